@@ -0,0 +1,165 @@
+from functools import lru_cache
+
+# Pseudo-rallies added to each side when estimating the rally win rate, so
+# early-set estimates stay close to an even match
+PRIOR_RALLIES = 10
+RECENT_RALLIES = 10
+
+# Longest set the state table is built for (the table grows with its square)
+MAX_MODELLED_POINTS = 99
+
+
+def _deuce_probability(p):
+    """From deuce, the first side two rallies clear wins"""
+    return p * p / (p * p + (1 - p) * (1 - p))
+
+
+def _decided(p, score1, score2, max_points, deuce_enabled):
+    """Win probability for finished and deuce states, None for any other state"""
+    if deuce_enabled:
+        if score1 >= max_points and score1 - score2 >= 2:
+            return 1.0
+        if score2 >= max_points and score2 - score1 >= 2:
+            return 0.0
+        if score1 >= max_points - 1 and score2 >= max_points - 1:
+            deuce = _deuce_probability(p)
+            if score1 == score2:
+                return deuce
+            return p + (1 - p) * deuce if score1 > score2 else p * deuce
+    else:
+        if score1 >= max_points:
+            return 1.0
+        if score2 >= max_points:
+            return 0.0
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _set_table(p, max_points, deuce_enabled):
+    """Win probability for every score below max_points, filled from the end of the set back"""
+    table = [[0.0] * max_points for _ in range(max_points)]
+    for score1 in range(max_points - 1, -1, -1):
+        for score2 in range(max_points - 1, -1, -1):
+            decided = _decided(p, score1, score2, max_points, deuce_enabled)
+            if decided is not None:
+                table[score1][score2] = decided
+                continue
+            win = _decided(p, score1 + 1, score2, max_points, deuce_enabled)
+            lose = _decided(p, score1, score2 + 1, max_points, deuce_enabled)
+            table[score1][score2] = (
+                p * (table[score1 + 1][score2] if win is None else win) +
+                (1 - p) * (table[score1][score2 + 1] if lose is None else lose)
+            )
+    return table
+
+
+def set_win_probability(p, score1, score2, max_points, deuce_enabled):
+    """Chance side 1 wins the set from this score when it wins each rally with probability p"""
+    decided = _decided(p, score1, score2, max_points, deuce_enabled)
+    if decided is not None:
+        return decided
+    return _set_table(p, max_points, deuce_enabled)[score1][score2]
+
+
+@lru_cache(maxsize=None)
+def _match_from_set_start(p, sets1, sets2, sets_needed, max_points, deuce_enabled):
+    """Chance side 1 wins the match at the start of a fresh set"""
+    if sets1 >= sets_needed:
+        return 1.0
+    if sets2 >= sets_needed:
+        return 0.0
+    fresh = set_win_probability(p, 0, 0, max_points, deuce_enabled)
+    return (fresh * _match_from_set_start(p, sets1 + 1, sets2, sets_needed, max_points, deuce_enabled) +
+            (1 - fresh) * _match_from_set_start(p, sets1, sets2 + 1, sets_needed, max_points, deuce_enabled))
+
+
+def match_win_probability(p, sets1, sets2, score1, score2, max_points, total_sets, deuce_enabled):
+    """Chance side 1 wins the match given sets won and the current set score"""
+    sets_needed = total_sets // 2 + 1
+    deuce_enabled = bool(deuce_enabled)
+    if sets1 >= sets_needed:
+        return 1.0
+    if sets2 >= sets_needed:
+        return 0.0
+    current = set_win_probability(p, score1, score2, max_points, deuce_enabled)
+    return (current * _match_from_set_start(p, sets1 + 1, sets2, sets_needed, max_points, deuce_enabled) +
+            (1 - current) * _match_from_set_start(p, sets1, sets2 + 1, sets_needed, max_points, deuce_enabled))
+
+
+def rally_win_rate(points1, points2):
+    """Smoothed share of rallies won by side 1, rounded so cached states are reused"""
+    p = (points1 + PRIOR_RALLIES) / (points1 + points2 + 2 * PRIOR_RALLIES)
+    return min(0.99, max(0.01, round(p, 2)))
+
+
+def rally_sequence(events):
+    """Rebuild the order of points won from logged score changes"""
+    sequence = []
+    for set_number, player, action in events:
+        if action == 'increment':
+            sequence.append((set_number, player))
+        elif action == 'decrement':
+            # Undo the most recent point of that player in that set
+            for i in range(len(sequence) - 1, -1, -1):
+                if sequence[i] == (set_number, player):
+                    del sequence[i]
+                    break
+    return sequence
+
+
+def momentum(sequence):
+    """Current run, longest runs and recent rally share"""
+    longest = {1: 0, 2: 0}
+    run_player, run_length = None, 0
+    for _, player in sequence:
+        run_length = run_length + 1 if player == run_player else 1
+        run_player = player
+        longest[player] = max(longest[player], run_length)
+
+    recent = [player for _, player in sequence[-RECENT_RALLIES:]]
+    return {
+        'current_run': {'player': run_player, 'points': run_length},
+        'longest_run': {'player1': longest[1], 'player2': longest[2]},
+        'recent_rallies': len(recent),
+        'recent_player1_share': recent.count(1) / len(recent) if recent else None
+    }
+
+
+def match_analytics(cursor, match_data, rally_table='rally'):
+    """Win probability and momentum for a match dict with its scores"""
+    scores = match_data['scores']
+    completed_sets = [s for s in scores if s['completed']]
+    sets1 = sum(1 for s in completed_sets if s['player1_score'] > s['player2_score'])
+    sets2 = sum(1 for s in completed_sets if s['player2_score'] > s['player1_score'])
+
+    current = next((s for s in scores
+                    if s['set_number'] == match_data['current_set'] and not s['completed']), None)
+    score1, score2 = (current['player1_score'], current['player2_score']) if current else (0, 0)
+
+    points1 = sum(s['player1_score'] for s in scores)
+    points2 = sum(s['player2_score'] for s in scores)
+    p = rally_win_rate(points1, points2)
+
+    if match_data['status'] == 'completed':
+        probability = 1.0 if sets1 > sets2 else 0.0 if sets2 > sets1 else 0.5
+    elif match_data['max_points'] > MAX_MODELLED_POINTS:
+        probability = None
+    else:
+        probability = match_win_probability(
+            p, sets1, sets2, score1, score2, match_data['max_points'],
+            match_data['total_sets'], match_data['deuce_enabled']
+        )
+
+    cursor.execute(f'''
+    SELECT set_number, player, action FROM {rally_table} WHERE match_id = ? ORDER BY id
+    ''', (match_data['id'],))
+    sequence = rally_sequence(cursor.fetchall())
+
+    return {
+        'rally_win_rate': {'player1': p, 'player2': round(1 - p, 2)},
+        'win_probability': None if probability is None else {
+            'player1': round(probability, 4),
+            'player2': round(1 - probability, 4)
+        },
+        'momentum': momentum(sequence)
+    }
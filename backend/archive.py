@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from db import get_db_connection, get_setting
+
+ARCHIVE_PATH = 'badminton_archive.db'
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+
+# Archived tables and the column linking each row to its match
+ARCHIVED_TABLES = {
+    'match': 'id',
+    'score': 'match_id',
+    'match_roster': 'match_id',
+    'rally': 'match_id'
+}
+
+ARCHIVE_INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_match_id ON match (id)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_match_date ON match (date)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_score_match ON score (match_id, set_number)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_roster_match ON match_roster (match_id, side, position)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_roster_player ON match_roster (player_id, match_id)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_rally_match ON rally (match_id, id)'
+]
+
+# View columns for the current archive file, keyed by its size and mtime
+_layout = {'signature': None, 'columns': None}
+_layout_lock = threading.Lock()
+
+
+def _columns(cursor, schema, table):
+    """(name, type) pairs for a table in the given schema"""
+    cursor.execute(f'PRAGMA {schema}.table_info({table})')
+    return [(row[1], row[2]) for row in cursor.fetchall()]
+
+
+def _is_attached(cursor):
+    cursor.execute('PRAGMA database_list')
+    return any(row[1] == 'archive' for row in cursor.fetchall())
+
+
+def prepare(conn):
+    """Attach the archive and bring its tables and indexes in line with the hot schema.
+
+    Runs when matches are archived and once at startup, so per-request
+    reads only have to attach it and create the views.
+    """
+    cursor = conn.cursor()
+    if not _is_attached(cursor):
+        cursor.execute('ATTACH DATABASE ? AS archive', (ARCHIVE_PATH,))
+
+    for table in ARCHIVED_TABLES:
+        columns = _columns(cursor, 'main', table)
+        archived = {name for name, _ in _columns(cursor, 'archive', table)}
+
+        # Keep the archive in step with columns added to the hot tables
+        if not archived:
+            cursor.execute(f'CREATE TABLE archive.{table} AS SELECT * FROM main.{table} WHERE 0')
+        for name, column_type in columns:
+            if archived and name not in archived:
+                cursor.execute(f'ALTER TABLE archive.{table} ADD COLUMN {name} {column_type}')
+
+    for statement in ARCHIVE_INDEXES:
+        cursor.execute(statement)
+
+
+def sync_schema():
+    """Align an existing archive with the current hot schema (after migrations)"""
+    if not os.path.exists(ARCHIVE_PATH):
+        return
+    with get_db_connection() as conn:
+        prepare(conn)
+        conn.commit()
+
+
+def _view_columns():
+    """Column names per archived table, or None while the archive holds no matches.
+
+    Cached against the archive file's size and modification time, so the
+    check costs one stat() until the archive changes.
+    """
+    try:
+        stat = os.stat(ARCHIVE_PATH)
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _layout_lock:
+        if _layout['signature'] == signature:
+            return _layout['columns']
+
+    conn = sqlite3.connect(ARCHIVE_PATH)
+    try:
+        columns = None
+        if conn.execute('SELECT 1 FROM match LIMIT 1').fetchone():
+            columns = {table: [name for name, _ in _columns(conn.cursor(), 'main', table)]
+                       for table in ARCHIVED_TABLES}
+    except sqlite3.OperationalError:
+        # Archive file exists but nothing has been archived into it yet
+        columns = None
+    finally:
+        conn.close()
+
+    with _layout_lock:
+        _layout['signature'] = signature
+        _layout['columns'] = columns
+    return columns
+
+
+def attach(conn):
+    """Expose <table>_all views over hot and archived rows.
+
+    Returns the table suffix to query: '_all', or '' when there is nothing
+    archived and the hot tables alone are complete.
+    """
+    columns = _view_columns()
+    if not columns:
+        return ''
+
+    cursor = conn.cursor()
+    if not _is_attached(cursor):
+        cursor.execute('ATTACH DATABASE ? AS archive', (ARCHIVE_PATH,))
+    for table, names in columns.items():
+        names = ', '.join(names)
+        cursor.execute(f'''
+        CREATE TEMP VIEW IF NOT EXISTS {table}_all AS
+        SELECT {names} FROM main.{table}
+        UNION ALL
+        SELECT {names} FROM archive.{table}
+        ''')
+    return '_all'
+
+
+def find_match(conn, match_id):
+    """Look a match up in the hot tables, falling back to the archive.
+
+    Returns the row and the table suffix ('' or '_all') to use for its
+    scores, roster and rallies.
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM match WHERE id = ?', (match_id,))
+    match = cursor.fetchone()
+    if match:
+        return match, ''
+
+    if not attach(conn):
+        return None, ''
+    cursor.execute('SELECT * FROM archive.match WHERE id = ?', (match_id,))
+    return cursor.fetchone(), '_all'
+
+
+def archive_matches(conn, older_than_days=None):
+    """Move completed matches older than the cutoff into the archive database"""
+    cursor = conn.cursor()
+    if older_than_days is None:
+        older_than_days = get_setting(cursor, 'archive_after_days', DEFAULT_ARCHIVE_AFTER_DAYS, int)
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d')
+
+    prepare(conn)
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+    cursor.execute('DELETE FROM archive_batch')
+    cursor.execute('''
+    INSERT INTO archive_batch (id)
+    SELECT id FROM main.match WHERE status = 'completed' AND date < ?
+    AND id NOT IN (SELECT id FROM archive.match)
+    ''', (cutoff,))
+    moved = cursor.rowcount
+
+    for table, key in ARCHIVED_TABLES.items():
+        names = ', '.join(name for name, _ in _columns(cursor, 'main', table))
+        cursor.execute(f'''
+        INSERT OR IGNORE INTO archive.{table} ({names})
+        SELECT {names} FROM main.{table} WHERE {key} IN (SELECT id FROM archive_batch)
+        ''')
+
+    # Also clears matches an interrupted earlier run left in both databases
+    removed = drop_archived_from_main(conn)
+    return {'archived': moved, 'repaired': removed - moved, 'cutoff_date': cutoff}
+
+
+def drop_archived_from_main(conn):
+    """Delete hot rows for every match the archive already holds.
+
+    With the main database in WAL mode a transaction spanning both files is
+    atomic per file only, so a crash can leave a match in both. The archive
+    copy is complete whenever its match row exists, so the hot copy can go.
+    """
+    cursor = conn.cursor()
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS archive_duplicate (id INTEGER PRIMARY KEY)')
+    cursor.execute('DELETE FROM archive_duplicate')
+    cursor.execute('''
+    INSERT INTO archive_duplicate (id)
+    SELECT m.id FROM main.match m JOIN archive.match a ON a.id = m.id
+    WHERE m.status = 'completed'
+    ''')
+    removed = cursor.rowcount
+
+    # Children first, then the matches themselves
+    for table, key in reversed(list(ARCHIVED_TABLES.items())):
+        cursor.execute(f'DELETE FROM main.{table} WHERE {key} IN (SELECT id FROM archive_duplicate)')
+    return removed
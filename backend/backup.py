@@ -0,0 +1,204 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import archive
+from db import DB_PATH, SCHEMA_VERSION, get_db_connection, get_setting, init_db
+
+BACKUP_DIR = 'backups'
+# Archive database copied alongside each snapshot as <snapshot name> + suffix
+ARCHIVE_SUFFIX = '.archive'
+DEFAULT_INTERVAL_MINUTES = 60
+DEFAULT_KEEP = 48
+PAGES_PER_STEP = 256
+
+_backup_lock = threading.Lock()
+_scheduler_started = False
+
+
+def enable_wal():
+    """Switch the live database to WAL so snapshot reads never block writers"""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+    finally:
+        conn.close()
+
+
+def list_snapshots():
+    """Snapshot files in the backup directory, newest first"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(BACKUP_DIR), reverse=True):
+        if not name.endswith('.db'):
+            continue
+        path = os.path.join(BACKUP_DIR, name)
+        archive_path = path + ARCHIVE_SUFFIX
+        snapshots.append({
+            'name': name,
+            'size_bytes': os.path.getsize(path),
+            'archive_size_bytes': os.path.getsize(archive_path) if os.path.exists(archive_path) else None,
+            'created_at': datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+        })
+    return snapshots
+
+
+def _prune(keep):
+    """Delete all but the newest `keep` snapshots"""
+    for snapshot in list_snapshots()[keep:]:
+        path = os.path.join(BACKUP_DIR, snapshot['name'])
+        os.remove(path)
+        if os.path.exists(path + ARCHIVE_SUFFIX):
+            os.remove(path + ARCHIVE_SUFFIX)
+
+
+def create_snapshot(label='manual', pages=PAGES_PER_STEP):
+    """Copy the live database to a new snapshot file with the online backup API.
+
+    Pages are copied a few at a time inside one read transaction, so the
+    copy is a consistent point-in-time view and, in WAL mode, scoring writes
+    carry on while it runs instead of restarting the backup. The archive
+    database is copied in the same read transaction, so the pair always
+    agrees on which matches have been archived.
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    label = re.sub(r'[^A-Za-z0-9_-]', '', label or '') or 'manual'
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    name = f'badminton-{stamp}-{label}.db'
+    path = os.path.join(BACKUP_DIR, name)
+    partial = path + '.partial'
+    archive_partial = path + ARCHIVE_SUFFIX + '.partial'
+
+    with _backup_lock:
+        started = time.perf_counter()
+        has_archive = os.path.exists(archive.ARCHIVE_PATH)
+        source = sqlite3.connect(DB_PATH, isolation_level=None)
+        target = sqlite3.connect(partial)
+        archive_target = sqlite3.connect(archive_partial) if has_archive else None
+        try:
+            if has_archive:
+                source.execute('ATTACH DATABASE ? AS archive', (archive.ARCHIVE_PATH,))
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            if has_archive:
+                source.execute('SELECT COUNT(*) FROM archive.sqlite_master').fetchone()
+            source.backup(target, pages=pages)
+            if has_archive:
+                source.backup(archive_target, pages=pages, name='archive')
+            source.execute('COMMIT')
+        finally:
+            if archive_target is not None:
+                archive_target.close()
+            target.close()
+            source.close()
+        if has_archive:
+            os.replace(archive_partial, path + ARCHIVE_SUFFIX)
+        os.replace(partial, path)
+
+        with get_db_connection() as conn:
+            keep = get_setting(conn, 'backup_keep', DEFAULT_KEEP, int)
+        _prune(keep)
+
+    return {
+        'name': name,
+        'size_bytes': os.path.getsize(path),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def restore_snapshot(name):
+    """Replace the live database contents with a snapshot.
+
+    The current state is snapshotted first so a restore can itself be undone.
+    Each copy runs in a single backup step, which holds the write lock only
+    for the length of the page copy. The archive is restored from the
+    snapshot's companion file; snapshots without one keep the current
+    archive, and matches it already holds are dropped from the restored
+    hot tables so nothing is listed twice. Snapshots from older schema
+    versions are migrated forward; ones from a newer version are refused.
+    """
+    if name not in {snapshot['name'] for snapshot in list_snapshots()}:
+        raise ValueError(f'Snapshot {name} not found')
+    path = os.path.join(BACKUP_DIR, name)
+
+    conn = sqlite3.connect(path)
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+    if version > SCHEMA_VERSION:
+        raise ValueError(f'Snapshot {name} has schema version {version}, '
+                         f'newer than this server ({SCHEMA_VERSION})')
+
+    safety = create_snapshot('pre-restore')
+
+    with _backup_lock:
+        started = time.perf_counter()
+        _copy_database(path, DB_PATH)
+        if os.path.exists(path + ARCHIVE_SUFFIX):
+            _copy_database(path + ARCHIVE_SUFFIX, archive.ARCHIVE_PATH)
+        init_db()
+        archive.sync_schema()
+        if os.path.exists(archive.ARCHIVE_PATH):
+            _reconcile_archive()
+
+    return {
+        'restored': name,
+        'pre_restore_snapshot': safety['name'],
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def _copy_database(source_path, target_path):
+    """Overwrite one database with another in a single backup step"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def _reconcile_archive():
+    """Drop restored hot rows the archive already holds and keep new ids clear of archived ones"""
+    with get_db_connection() as conn:
+        archive.prepare(conn)
+        archive.drop_archived_from_main(conn)
+        conn.execute('''
+        UPDATE sqlite_sequence SET seq = (SELECT MAX(id) FROM archive.match)
+        WHERE name = 'match' AND seq < (SELECT MAX(id) FROM archive.match)
+        ''')
+        conn.commit()
+
+
+def _run_scheduler(stop_event):
+    """Take a snapshot every backup_interval_minutes (0 disables)"""
+    last_snapshot = time.monotonic()
+    while not stop_event.wait(60):
+        try:
+            with get_db_connection() as conn:
+                interval = get_setting(conn, 'backup_interval_minutes', DEFAULT_INTERVAL_MINUTES, int)
+            if interval <= 0 or time.monotonic() - last_snapshot < interval * 60:
+                continue
+            create_snapshot('scheduled')
+        except (sqlite3.Error, OSError) as e:
+            print(f'Scheduled snapshot failed: {e}')
+        last_snapshot = time.monotonic()
+
+
+def start_scheduler():
+    """Start the periodic snapshot thread once per process"""
+    global _scheduler_started
+    if _scheduler_started:
+        return None
+    _scheduler_started = True
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_run_scheduler, args=(stop_event,), daemon=True)
+    thread.start()
+    return stop_event
@@ -0,0 +1,304 @@
+import threading
+
+import archive
+from db import get_db_connection
+from roster import normalize_team, save_roster, team_label
+
+_state_cache = {}
+_state_lock = threading.Lock()
+
+
+def seed_order(size):
+    """Standard seeding positions so top seeds meet as late as possible"""
+    order = [1]
+    while len(order) < size:
+        order = [seed for s in order for seed in (s, 2 * len(order) + 1 - s)]
+    return order
+
+
+def _insert_fixture(cursor, bracket, match_number, teams, status):
+    """Insert one generated match with its score rows and roster"""
+    cursor.execute('''
+    INSERT INTO match (
+        event_type, match_number, date, time, court, umpire, service_judge,
+        max_points, total_sets, deuce_enabled, player1, player2, status,
+        shuttles_used
+    ) VALUES (?, ?, ?, ?, ?, NULL, NULL, ?, ?, ?, ?, ?, ?, 0)
+    ''', (
+        bracket['event_type'], match_number, bracket['date'], bracket['time'],
+        bracket['court'], bracket['max_points'], bracket['total_sets'],
+        bracket['deuce_enabled'], team_label(teams[1]), team_label(teams[2]), status
+    ))
+    match_id = cursor.lastrowid
+
+    cursor.executemany('''
+    INSERT INTO score (match_id, set_number, player1_score, player2_score, completed)
+    VALUES (?, ?, 0, 0, 0)
+    ''', [(match_id, i) for i in range(1, bracket['total_sets'] + 1)])
+
+    save_roster(cursor, match_id, teams)
+    return match_id
+
+
+def _insert_slot(cursor, bracket_id, match_id, round_number, position):
+    """Record where a generated match sits in the draw"""
+    cursor.execute('''
+    INSERT INTO bracket_slot (bracket_id, match_id, round, position)
+    VALUES (?, ?, ?, ?)
+    ''', (bracket_id, match_id, round_number, position))
+
+
+def _generate_knockout(cursor, bracket_id, bracket, entrants):
+    """Create every round of a seeded single-elimination draw"""
+    size = 1
+    while size < len(entrants):
+        size *= 2
+
+    # Round one positions; missing seeds are byes that advance their opponent
+    positions = [entrants[seed - 1] if seed <= len(entrants) else None
+                 for seed in seed_order(size)]
+    nodes = []
+    round_number = 1
+    for position, i in enumerate(range(0, size, 2), start=1):
+        first, second = positions[i], positions[i + 1]
+        if first is None or second is None:
+            nodes.append(('entrant', first or second))
+            continue
+        match_number = f'B{bracket_id}-R1-{position}'
+        match_id = _insert_fixture(cursor, bracket, match_number, {1: first, 2: second}, 'scheduled')
+        _insert_slot(cursor, bracket_id, match_id, round_number, position)
+        nodes.append(('match', (match_id, match_number)))
+
+    while len(nodes) > 1:
+        round_number += 1
+        next_nodes = []
+        for position, i in enumerate(range(0, len(nodes), 2), start=1):
+            sides = {}
+            feeders = []
+            for side, (kind, value) in enumerate(nodes[i:i + 2], start=1):
+                if kind == 'entrant':
+                    sides[side] = value
+                else:
+                    sides[side] = [(None, f'Winner of {value[1]}')]
+                    feeders.append((value[0], side))
+
+            match_number = f'B{bracket_id}-R{round_number}-{position}'
+            status = 'pending' if feeders else 'scheduled'
+            match_id = _insert_fixture(cursor, bracket, match_number, sides, status)
+            _insert_slot(cursor, bracket_id, match_id, round_number, position)
+            cursor.executemany('''
+            UPDATE bracket_slot SET next_match_id = ?, next_side = ? WHERE match_id = ?
+            ''', [(match_id, side, feeder_id) for feeder_id, side in feeders])
+            next_nodes.append(('match', (match_id, match_number)))
+        nodes = next_nodes
+
+
+def _generate_round_robin(cursor, bracket_id, bracket, entrants):
+    """Create every fixture of a round robin using the circle method"""
+    rotation = list(entrants) + ([None] if len(entrants) % 2 else [])
+    half = len(rotation) // 2
+    for round_number in range(1, len(rotation)):
+        pairs = [(rotation[i], rotation[-1 - i]) for i in range(half)]
+        pairs = [pair for pair in pairs if pair[0] is not None and pair[1] is not None]
+        for position, (first, second) in enumerate(pairs, start=1):
+            match_number = f'B{bracket_id}-RR{round_number}-{position}'
+            match_id = _insert_fixture(cursor, bracket, match_number, {1: first, 2: second}, 'scheduled')
+            _insert_slot(cursor, bracket_id, match_id, round_number, position)
+        rotation = [rotation[0], rotation[-1]] + rotation[1:-1]
+
+
+def create_bracket(cursor, data):
+    """Insert a bracket and all of its fixtures; the caller commits"""
+    draw_format = data.get('format', 'knockout')
+    if draw_format not in ('knockout', 'round_robin'):
+        raise ValueError("Format must be 'knockout' or 'round_robin'")
+
+    entrants = [normalize_team(cursor, entrant) for entrant in data.get('entrants', [])]
+    if len(entrants) < 2:
+        raise ValueError('A draw needs at least two entrants')
+    if any(not entrant for entrant in entrants):
+        raise ValueError('Every entrant needs at least one player')
+
+    bracket = {
+        'event_type': data['event_type'],
+        'date': data['date'],
+        'time': data.get('time', '00:00'),
+        'court': data.get('court', ''),
+        'max_points': data.get('max_points', 21),
+        'total_sets': data.get('total_sets', 3),
+        'deuce_enabled': data.get('deuce_enabled', True)
+    }
+
+    cursor.execute('''
+    INSERT INTO bracket (name, event_type, format) VALUES (?, ?, ?)
+    ''', (data.get('name') or f"{bracket['event_type']} {draw_format.replace('_', ' ')}",
+          bracket['event_type'], draw_format))
+    bracket_id = cursor.lastrowid
+
+    if draw_format == 'knockout':
+        _generate_knockout(cursor, bracket_id, bracket, entrants)
+    else:
+        _generate_round_robin(cursor, bracket_id, bracket, entrants)
+
+    return bracket_id
+
+
+def _winner_side(cursor, match_id):
+    """Side (1 or 2) that won more completed sets, or None for a draw"""
+    cursor.execute('''
+    SELECT COALESCE(SUM(CASE WHEN player1_score > player2_score THEN 1 ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN player2_score > player1_score THEN 1 ELSE 0 END), 0)
+    FROM score WHERE match_id = ? AND completed = 1
+    ''', (match_id,))
+    side1_sets, side2_sets = cursor.fetchone()
+    if side1_sets == side2_sets:
+        return None
+    return 1 if side1_sets > side2_sets else 2
+
+
+def is_pending(cursor, match_id):
+    """True for a bracket match still waiting on its feeder matches"""
+    cursor.execute('SELECT status FROM match WHERE id = ?', (match_id,))
+    row = cursor.fetchone()
+    return bool(row and row[0] == 'pending')
+
+
+def bracket_of(cursor, match_id):
+    """Bracket id a match belongs to, or None"""
+    cursor.execute('SELECT bracket_id FROM bracket_slot WHERE match_id = ?', (match_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def advance(cursor, match_id):
+    """Move the winner of a completed knockout match into its next match"""
+    cursor.execute('''
+    SELECT next_match_id, next_side FROM bracket_slot WHERE match_id = ?
+    ''', (match_id,))
+    slot = cursor.fetchone()
+    if not slot or not slot['next_match_id']:
+        return None
+
+    # A draw would leave the next round waiting forever, so refuse it
+    winner = _winner_side(cursor, match_id)
+    if winner is None:
+        raise ValueError('Knockout match has no winner; settle the sets before ending it')
+
+    cursor.execute('''
+    SELECT player_id, player_name FROM match_roster
+    WHERE match_id = ? AND side = ? ORDER BY position
+    ''', (match_id, winner))
+    team = [(row['player_id'], row['player_name']) for row in cursor.fetchall()]
+
+    next_match_id, next_side = slot['next_match_id'], slot['next_side']
+    cursor.execute('SELECT status FROM match WHERE id = ?', (next_match_id,))
+    next_status = cursor.fetchone()[0]
+    if next_status not in ('pending', 'scheduled'):
+        raise ValueError(f'Next bracket match is already {next_status}; it cannot take a new entrant')
+
+    save_roster(cursor, next_match_id, {next_side: team})
+
+    # The next match is ready once every feeder match has finished
+    cursor.execute('''
+    SELECT COUNT(*) FROM bracket_slot s JOIN match m ON m.id = s.match_id
+    WHERE s.next_match_id = ? AND m.status != 'completed'
+    ''', (next_match_id,))
+    waiting = cursor.fetchone()[0]
+
+    cursor.execute(f'''
+    UPDATE match SET player{next_side} = ?,
+    status = CASE WHEN status = 'pending' AND ? = 0 THEN 'scheduled' ELSE status END,
+    version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+    ''', (team_label(team), waiting, next_match_id))
+    return next_match_id
+
+
+def _standings(matches):
+    """Round robin table ordered by wins, then set and point difference"""
+    table = {}
+    for match in matches:
+        for side in (1, 2):
+            entry = table.setdefault(match[f'player{side}'], {
+                'name': match[f'player{side}'], 'played': 0, 'won': 0, 'lost': 0,
+                'sets_diff': 0, 'points_diff': 0
+            })
+            if match['status'] != 'completed':
+                continue
+            own, other = (1, 2) if side == 1 else (2, 1)
+            entry['played'] += 1
+            entry['won'] += match['winner'] == side
+            entry['lost'] += match['winner'] == other
+            entry['sets_diff'] += match[f'sets{own}'] - match[f'sets{other}']
+            entry['points_diff'] += match[f'points{own}'] - match[f'points{other}']
+    return sorted(table.values(), key=lambda e: (-e['won'], -e['sets_diff'], -e['points_diff'], e['name']))
+
+
+def _build_state(cursor, bracket_id, suffix=''):
+    """Rounds, results and standings or champion for a bracket"""
+    cursor.execute('SELECT * FROM bracket WHERE id = ?', (bracket_id,))
+    bracket = cursor.fetchone()
+    if not bracket:
+        return None
+
+    cursor.execute(f'''
+    SELECT s.round, s.position, s.match_id, s.next_match_id, s.next_side,
+           m.match_number, m.player1, m.player2, m.status, m.court, m.date, m.time,
+           COALESCE(SUM(CASE WHEN sc.completed = 1 AND sc.player1_score > sc.player2_score THEN 1 ELSE 0 END), 0) AS sets1,
+           COALESCE(SUM(CASE WHEN sc.completed = 1 AND sc.player2_score > sc.player1_score THEN 1 ELSE 0 END), 0) AS sets2,
+           COALESCE(SUM(sc.player1_score), 0) AS points1,
+           COALESCE(SUM(sc.player2_score), 0) AS points2
+    FROM bracket_slot s
+    JOIN match{suffix} m ON m.id = s.match_id
+    LEFT JOIN score{suffix} sc ON sc.match_id = m.id
+    WHERE s.bracket_id = ?
+    GROUP BY s.id
+    ORDER BY s.round, s.position
+    ''', (bracket_id,))
+
+    rounds = {}
+    matches = []
+    for row in cursor.fetchall():
+        match = dict(row)
+        match['winner'] = None
+        if match['status'] == 'completed' and match['sets1'] != match['sets2']:
+            match['winner'] = 1 if match['sets1'] > match['sets2'] else 2
+        matches.append(match)
+        rounds.setdefault(match['round'], []).append(match)
+
+    state = dict(bracket)
+    state['rounds'] = [{'round': number, 'matches': round_matches}
+                       for number, round_matches in sorted(rounds.items())]
+    if bracket['format'] == 'round_robin':
+        state['standings'] = _standings(matches)
+    else:
+        final = state['rounds'][-1]['matches'] if state['rounds'] else []
+        state['champion'] = None
+        if len(final) == 1 and final[0]['winner']:
+            state['champion'] = final[0][f"player{final[0]['winner']}"]
+    return state
+
+
+def get_bracket(bracket_id):
+    """Cached bracket state, rebuilt after invalidate()"""
+    with _state_lock:
+        if bracket_id in _state_cache:
+            return _state_cache[bracket_id]
+
+    with get_db_connection() as conn:
+        suffix = archive.attach(conn)
+        state = _build_state(conn.cursor(), bracket_id, suffix)
+
+    if state is not None:
+        with _state_lock:
+            _state_cache[bracket_id] = state
+    return state
+
+
+def invalidate(bracket_id=None):
+    """Drop cached bracket state"""
+    with _state_lock:
+        if bracket_id is None:
+            _state_cache.clear()
+        else:
+            _state_cache.pop(bracket_id, None)
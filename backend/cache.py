@@ -0,0 +1,132 @@
+import threading
+import time
+
+from db import get_db_connection, get_setting
+
+# Short-lived response cache for hot read endpoints. Concurrent misses on the
+# same key share one computation (single-flight), so a burst of identical
+# requests costs one database query per key per TTL. Only requests that would
+# run a query are charged against the per-client rate limit.
+DEFAULT_TTL_SECONDS = 2
+MAX_ENTRIES = 256
+
+# Per-client token bucket defaults (settings rate_limit_per_second and
+# rate_limit_burst override them; a rate of 0 turns limiting off)
+DEFAULT_RATE_PER_SECOND = 5
+DEFAULT_RATE_BURST = 20
+MAX_CLIENTS = 10000
+
+_entries = {}
+_flights = {}
+_generation = 0
+_cache_lock = threading.Lock()
+
+_buckets = {}
+_bucket_lock = threading.Lock()
+_limits = None
+
+
+class _Flight:
+    """A computation in progress that other requests for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _store(key, value, ttl):
+    """Remember a value, evicting expired (then oldest) entries when full"""
+    now = time.monotonic()
+    if len(_entries) >= MAX_ENTRIES:
+        for stale in [k for k, (expires, _) in _entries.items() if expires <= now]:
+            del _entries[stale]
+    if len(_entries) >= MAX_ENTRIES:
+        del _entries[min(_entries, key=lambda k: _entries[k][0])]
+    _entries[key] = (now + ttl, value)
+
+
+def is_warm(key):
+    """True if a request for key would be served without running the view"""
+    with _cache_lock:
+        entry = _entries.get(key)
+        return key in _flights or bool(entry and entry[0] > time.monotonic())
+
+
+def get_or_compute(key, compute, ttl=DEFAULT_TTL_SECONDS):
+    """Cached value for key, computing it at most once at a time across threads"""
+    with _cache_lock:
+        entry = _entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            generation = _generation
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    try:
+        flight.value = compute()
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _cache_lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+            # A result computed before an invalidate() may already be stale
+            if flight.error is None and generation == _generation:
+                _store(key, flight.value, ttl)
+        flight.done.set()
+    return flight.value
+
+
+def invalidate():
+    """Drop cached responses so the next request reads fresh data"""
+    global _generation, _limits
+    with _cache_lock:
+        _generation += 1
+        _entries.clear()
+        _flights.clear()
+    # Settings changes also come through here
+    _limits = None
+
+
+def _rate_limits():
+    """(requests per second, burst) from settings, read once until invalidate()"""
+    global _limits
+    if _limits is None:
+        with get_db_connection() as conn:
+            rate = get_setting(conn, 'rate_limit_per_second', DEFAULT_RATE_PER_SECOND, float)
+            burst = get_setting(conn, 'rate_limit_burst', DEFAULT_RATE_BURST, float)
+        _limits = (rate, max(1.0, burst))
+    return _limits
+
+
+def allow_request(client):
+    """Take a token from the client's bucket; returns seconds to wait, or 0 if allowed"""
+    rate, burst = _rate_limits()
+    if rate <= 0:
+        return 0
+
+    now = time.monotonic()
+    with _bucket_lock:
+        tokens, updated = _buckets.get(client, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            _buckets[client] = (tokens, now)
+            return (1 - tokens) / rate
+
+        _buckets[client] = (tokens - 1, now)
+        if len(_buckets) > MAX_CLIENTS:
+            # Forget clients whose buckets have refilled; they start full anyway
+            idle = burst / rate
+            for stale in [c for c, (_, t) in _buckets.items() if now - t > idle]:
+                del _buckets[stale]
+        return 0
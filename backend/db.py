@@ -1,23 +1,28 @@
 import sqlite3
+import threading
 from contextlib import contextmanager
 
+DB_PATH = 'badminton.db'
+
+_migration_lock = threading.Lock()
+
 @contextmanager
 def get_db_connection():
     """Context manager for database connections"""
-    conn = sqlite3.connect('badminton.db')
+    conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
     finally:
         conn.close()
 
-def init_db():
-    """Initialize the database with required tables"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Match table
-        cursor.execute('''
+# Schema migrations, applied in order. The database's PRAGMA user_version
+# records how many have run, so each one runs exactly once. Append new
+# migrations to the end; never edit one that has shipped.
+MIGRATIONS = [
+    # 1: Base match, score, player and settings tables
+    [
+        '''
         CREATE TABLE IF NOT EXISTS match (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             event_type TEXT NOT NULL,
@@ -41,10 +46,8 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        ''')
-        
-        # Score table
-        cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS score (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             match_id INTEGER NOT NULL,
@@ -56,10 +59,8 @@ def init_db():
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (match_id) REFERENCES match (id) ON DELETE CASCADE
         )
-        ''')
-        
-        # Player table
-        cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS player (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -69,29 +70,217 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        ''')
-        
-        # Settings table
-        cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS settings (
             key TEXT PRIMARY KEY,
             value TEXT NOT NULL,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        ''')
-        
-        # Insert default settings
-        cursor.execute('''
+        ''',
+        '''
         INSERT OR IGNORE INTO settings (key, value) VALUES
         ('default_max_points', '21'),
         ('default_total_sets', '3'),
         ('default_deuce_enabled', '1'),
         ('default_courts', '1,2,3,4'),
         ('default_event_types', 'Mens Singles,Mens Doubles,Womens Singles,Womens Doubles,Mixed Doubles,Boys Singles U17,Girls Doubles U17,Boys Singles U19,Girls Singles U17,Girls Singles U19,Boys Doubles U17')
-        ''')
-        
-        conn.commit()
+        '''
+    ],
+    # 2: Match roster table (one row per player per side, up to two for doubles)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS match_roster (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_id INTEGER NOT NULL,
+            side INTEGER NOT NULL CHECK (side IN (1, 2)),
+            position INTEGER NOT NULL CHECK (position IN (1, 2)),
+            player_id INTEGER,
+            player_name TEXT NOT NULL,
+            FOREIGN KEY (match_id) REFERENCES match (id) ON DELETE CASCADE,
+            FOREIGN KEY (player_id) REFERENCES player (id) ON DELETE SET NULL,
+            UNIQUE (match_id, side, position)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_score_match ON score (match_id, set_number)',
+        'CREATE INDEX IF NOT EXISTS idx_roster_player ON match_roster (player_id, match_id)',
+        # Backfill rosters for matches created before the roster table existed
+        '''
+        INSERT INTO match_roster (match_id, side, position, player_name)
+        SELECT m.id, 1, 1, m.player1 FROM match m
+        WHERE NOT EXISTS (SELECT 1 FROM match_roster r WHERE r.match_id = m.id AND r.side = 1)
+        ''',
+        '''
+        INSERT INTO match_roster (match_id, side, position, player_name)
+        SELECT m.id, 2, 1, m.player2 FROM match m
+        WHERE NOT EXISTS (SELECT 1 FROM match_roster r WHERE r.match_id = m.id AND r.side = 2)
+        '''
+    ],
+    # 3: Court scheduling settings
+    [
+        '''
+        INSERT OR IGNORE INTO settings (key, value) VALUES
+        ('default_match_minutes', '30'),
+        ('min_rest_minutes', '20')
+        '''
+    ],
+    # 4: Player ratings (precomputed leaderboard) and matches already rated
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS player_rating (
+            player_key TEXT PRIMARY KEY,
+            player_id INTEGER,
+            player_name TEXT NOT NULL,
+            rating REAL NOT NULL,
+            matches INTEGER DEFAULT 0,
+            wins INTEGER DEFAULT 0,
+            losses INTEGER DEFAULT 0,
+            last_match_id INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_player_rating_rating ON player_rating (rating DESC)',
+        '''
+        CREATE TABLE IF NOT EXISTS rated_match (
+            match_id INTEGER PRIMARY KEY,
+            rated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "INSERT OR IGNORE INTO settings (key, value) VALUES ('rating_k_factor', '32')"
+    ],
+    # 5: Bracket tables (generated draws and where each match sits in them)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS bracket (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            format TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bracket_slot (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bracket_id INTEGER NOT NULL,
+            match_id INTEGER NOT NULL UNIQUE,
+            round INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            next_match_id INTEGER,
+            next_side INTEGER,
+            FOREIGN KEY (bracket_id) REFERENCES bracket (id) ON DELETE CASCADE,
+            FOREIGN KEY (match_id) REFERENCES match (id) ON DELETE CASCADE
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_bracket_slot_bracket ON bracket_slot (bracket_id, round, position)',
+        'CREATE INDEX IF NOT EXISTS idx_bracket_slot_next ON bracket_slot (next_match_id)'
+    ],
+    # 6: Rally log (one row per score change, used for momentum analytics)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS rally (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_id INTEGER NOT NULL,
+            set_number INTEGER NOT NULL,
+            player INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            player1_score INTEGER NOT NULL,
+            player2_score INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (match_id) REFERENCES match (id) ON DELETE CASCADE
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_rally_match ON rally (match_id, id)'
+    ],
+    # 7: Archive settings
+    [
+        "INSERT OR IGNORE INTO settings (key, value) VALUES ('archive_after_days', '180')"
+    ],
+    # 8: Snapshot scheduler settings
+    [
+        '''
+        INSERT OR IGNORE INTO settings (key, value) VALUES
+        ('backup_interval_minutes', '60'),
+        ('backup_keep', '48')
+        '''
+    ],
+    # 9: Match version counter for optimistic concurrency checks
+    [
+        'ALTER TABLE match ADD COLUMN version INTEGER NOT NULL DEFAULT 1'
+    ],
+    # 10: Shuttle and court occupancy events with hourly/daily rollups per court
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS usage_event (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_id INTEGER NOT NULL,
+            court TEXT NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('shuttle', 'start', 'end')),
+            ts TEXT NOT NULL,
+            value INTEGER NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_usage_event_match ON usage_event (match_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS usage_rollup (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            court TEXT NOT NULL,
+            shuttles INTEGER DEFAULT 0,
+            busy_seconds REAL DEFAULT 0,
+            matches INTEGER DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, court)
+        ) WITHOUT ROWID
+        '''
+    ],
+    # 11: Per-client rate limit for the hot read endpoints
+    [
+        '''
+        INSERT OR IGNORE INTO settings (key, value) VALUES
+        ('rate_limit_per_second', '5'),
+        ('rate_limit_burst', '20')
+        '''
+    ]
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def _schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def init_db():
+    """Bring the database schema up to date, doing nothing if it already is"""
+    with get_db_connection() as conn:
+        # Fast path: a current schema costs a single pragma read
+        if _schema_version(conn) >= SCHEMA_VERSION:
+            return
+
+        with _migration_lock:
+            # Manage the transaction by hand so DDL and user_version commit together
+            conn.isolation_level = None
+            # BEGIN IMMEDIATE takes the write lock, so other processes wait here
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                version = _schema_version(conn)
+                for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute(f'PRAGMA user_version = {number}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+def get_setting(cursor, key, default, cast=str):
+    """Read a value from the settings table, falling back when missing or invalid"""
+    row = cursor.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return default
+    try:
+        return cast(row[0])
+    except (TypeError, ValueError):
+        return default
 
 def get_db():
     """Get a database connection"""
-    return get_db_connection()
\ No newline at end of file
+    return get_db_connection()
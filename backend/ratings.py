@@ -0,0 +1,149 @@
+from db import get_setting
+from roster import player_key
+
+INITIAL_RATING = 1500.0
+DEFAULT_K_FACTOR = 32.0
+
+
+def _k_factor(cursor):
+    """Rating step size from settings"""
+    return get_setting(cursor, 'rating_k_factor', DEFAULT_K_FACTOR, float)
+
+
+def expected_score(team1_rating, team2_rating):
+    """Elo expectation that side 1 beats side 2"""
+    return 1 / (1 + 10 ** ((team2_rating - team1_rating) / 400))
+
+
+def _load_results(cursor, match_ids_sql='', params=(), suffix=''):
+    """Completed matches in play order as (match_id, side1 keys, side2 keys, side1 result)"""
+    cursor.execute(f'''
+    SELECT m.id,
+           COALESCE(SUM(CASE WHEN s.player1_score > s.player2_score THEN 1 ELSE 0 END), 0) AS side1_sets,
+           COALESCE(SUM(CASE WHEN s.player2_score > s.player1_score THEN 1 ELSE 0 END), 0) AS side2_sets
+    FROM match{suffix} m
+    LEFT JOIN score{suffix} s ON s.match_id = m.id AND s.completed = 1
+    WHERE m.status = 'completed' {match_ids_sql}
+    GROUP BY m.id
+    ORDER BY m.end_time, m.id
+    ''', params)
+    results = [(row[0], 1.0 if row[1] > row[2] else 0.0 if row[1] < row[2] else 0.5)
+               for row in cursor.fetchall()]
+
+    cursor.execute(f'''
+    SELECT r.match_id, r.side, r.player_id, r.player_name
+    FROM match_roster{suffix} r JOIN match{suffix} m ON m.id = r.match_id
+    WHERE m.status = 'completed' {match_ids_sql}
+    ''', params)
+    sides = {}
+    names = {}
+    for match_id, side, player_id, player_name in cursor.fetchall():
+        key = player_key(player_id, player_name)
+        names[key] = (player_id, player_name)
+        sides.setdefault((match_id, side), []).append(key)
+
+    matches = [(match_id, sides.get((match_id, 1), []), sides.get((match_id, 2), []), result)
+               for match_id, result in results]
+    return [m for m in matches if m[1] and m[2]], names
+
+
+def _apply_result(ratings, team1, team2, result, k_factor):
+    """Update a ratings dict in place for one match; doubles use the pair average"""
+    team1_rating = sum(ratings.get(key, INITIAL_RATING) for key in team1) / len(team1)
+    team2_rating = sum(ratings.get(key, INITIAL_RATING) for key in team2) / len(team2)
+    delta = k_factor * (result - expected_score(team1_rating, team2_rating))
+    for key in team1:
+        ratings[key] = ratings.get(key, INITIAL_RATING) + delta
+    for key in team2:
+        ratings[key] = ratings.get(key, INITIAL_RATING) - delta
+
+
+def _tally(matches):
+    """Matches, wins and losses per player key"""
+    records = {}
+    for match_id, team1, team2, result in matches:
+        for team, team_result in ((team1, result), (team2, 1 - result)):
+            for key in team:
+                record = records.setdefault(key, {'matches': 0, 'wins': 0, 'losses': 0, 'last_match_id': None})
+                record['matches'] += 1
+                record['wins'] += team_result == 1
+                record['losses'] += team_result == 0
+                record['last_match_id'] = match_id
+    return records
+
+
+def _replay_sequential(matches, k_factor):
+    """Replay history one match at a time"""
+    ratings = {}
+    for _, team1, team2, result in matches:
+        _apply_result(ratings, team1, team2, result, k_factor)
+    return ratings
+
+
+def _save(cursor, ratings, records, names):
+    """Upsert rating rows for the given player keys"""
+    cursor.executemany('''
+    INSERT OR REPLACE INTO player_rating (
+        player_key, player_id, player_name, rating, matches, wins, losses,
+        last_match_id, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', [(key, names[key][0], names[key][1], rating,
+           records[key]['matches'], records[key]['wins'], records[key]['losses'],
+           records[key]['last_match_id'])
+          for key, rating in ratings.items()])
+
+
+def record_match(cursor, match_id):
+    """Apply a just-completed match to the stored ratings (once per match)"""
+    cursor.execute('INSERT OR IGNORE INTO rated_match (match_id) VALUES (?)', (match_id,))
+    if cursor.rowcount == 0:
+        return False
+
+    matches, names = _load_results(cursor, 'AND m.id = ?', (match_id,))
+    if not matches:
+        return False
+    _, team1, team2, result = matches[0]
+
+    keys = team1 + team2
+    cursor.execute(f'''
+    SELECT player_key, rating, matches, wins, losses FROM player_rating
+    WHERE player_key IN ({', '.join('?' * len(keys))})
+    ''', keys)
+    stored = {row[0]: row for row in cursor.fetchall()}
+
+    ratings = {key: stored[key][1] for key in stored}
+    _apply_result(ratings, team1, team2, result, _k_factor(cursor))
+
+    records = _tally(matches)
+    for key, record in records.items():
+        if key in stored:
+            record['matches'] += stored[key][2]
+            record['wins'] += stored[key][3]
+            record['losses'] += stored[key][4]
+
+    _save(cursor, ratings, records, names)
+    return True
+
+
+def recompute_all(cursor, suffix=''):
+    """Rebuild every rating by replaying the full completed-match history"""
+    matches, names = _load_results(cursor, suffix=suffix)
+    ratings = _replay_sequential(matches, _k_factor(cursor))
+
+    cursor.execute('DELETE FROM player_rating')
+    cursor.execute('DELETE FROM rated_match')
+    _save(cursor, ratings, _tally(matches), names)
+    cursor.executemany('INSERT INTO rated_match (match_id) VALUES (?)',
+                       [(match[0],) for match in matches])
+    return len(matches)
+
+
+def leaderboard(cursor, limit=50, min_matches=0):
+    """Top rated players from the precomputed rating table"""
+    cursor.execute('''
+    SELECT player_id, player_name, rating, matches, wins, losses, updated_at
+    FROM player_rating WHERE matches >= ?
+    ORDER BY rating DESC LIMIT ?
+    ''', (min_matches, limit))
+    return [dict(row, rank=rank, rating=round(row['rating'], 1))
+            for rank, row in enumerate(cursor.fetchall(), start=1)]
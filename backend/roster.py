@@ -0,0 +1,117 @@
+MAX_PLAYERS_PER_SIDE = 2
+
+
+def player_key(player_id, player_name):
+    """Stable identity for registered and free-text players"""
+    return f'id:{player_id}' if player_id else f'name:{player_name.strip().lower()}'
+
+
+def _resolve_entry(cursor, entry):
+    """Turn a roster entry (name, player id or dict) into (player_id, name)"""
+    if isinstance(entry, dict):
+        player_id = entry.get('player_id', entry.get('id'))
+        name = entry.get('name')
+    elif isinstance(entry, int) and not isinstance(entry, bool):
+        player_id, name = entry, None
+    else:
+        player_id, name = None, entry
+
+    if player_id is not None:
+        cursor.execute('SELECT name FROM player WHERE id = ?', (player_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise ValueError(f'Player {player_id} not found')
+        return player_id, name or row[0]
+
+    name = (name or '').strip()
+    if not name:
+        raise ValueError('Roster entries need a player name or id')
+
+    # Link free-text names to a registered player only when unambiguous
+    cursor.execute('SELECT id FROM player WHERE name = ? LIMIT 2', (name,))
+    rows = cursor.fetchall()
+    return (rows[0][0] if len(rows) == 1 else None), name
+
+
+def normalize_team(cursor, entries):
+    """Validate a side's roster and return a list of (player_id, name)"""
+    if entries is None:
+        return []
+    if not isinstance(entries, (list, tuple)):
+        entries = [entries]
+    if len(entries) > MAX_PLAYERS_PER_SIDE:
+        raise ValueError(f'A side can have at most {MAX_PLAYERS_PER_SIDE} players')
+    return [_resolve_entry(cursor, entry) for entry in entries]
+
+
+def team_label(team):
+    """Display string stored in match.player1 / match.player2"""
+    return ' / '.join(name for _, name in team)
+
+
+def teams_from_request(cursor, data):
+    """Build both sides from request data, falling back to player1/player2 text"""
+    teams = {}
+    for side in (1, 2):
+        team = normalize_team(cursor, data.get(f'team{side}'))
+        if not team and data.get(f'player{side}'):
+            team = normalize_team(cursor, [data[f'player{side}']])
+        teams[side] = team
+    return teams
+
+
+def teams_for_update(cursor, match_id, data):
+    """Sides whose roster an edit replaces.
+
+    An explicit team list always replaces the side. A bare player1/player2
+    label only relinks a singles side; on a doubles side it is just the
+    display text, so the linked pair is kept.
+    """
+    teams = {}
+    for side in (1, 2):
+        if f'team{side}' in data:
+            teams[side] = normalize_team(cursor, data[f'team{side}'])
+        elif f'player{side}' in data:
+            label = data[f'player{side}']
+            cursor.execute('SELECT COUNT(*) FROM match_roster WHERE match_id = ? AND side = ?',
+                           (match_id, side))
+            if not label or cursor.fetchone()[0] <= 1:
+                teams[side] = normalize_team(cursor, [label] if label else [])
+    return teams
+
+
+def save_roster(cursor, match_id, teams):
+    """Replace the stored roster for the given sides of a match"""
+    for side, team in teams.items():
+        cursor.execute('DELETE FROM match_roster WHERE match_id = ? AND side = ?',
+                       (match_id, side))
+        cursor.executemany('''
+        INSERT INTO match_roster (match_id, side, position, player_id, player_name)
+        VALUES (?, ?, ?, ?, ?)
+        ''', [(match_id, side, position, player_id, name)
+              for position, (player_id, name) in enumerate(team, start=1)])
+
+
+def fetch_rosters(cursor, match_filter_sql, params, table='match_roster'):
+    """Load rosters for all matches selected by a subquery, keyed by match id"""
+    cursor.execute(f'''
+    SELECT match_id, side, player_id, player_name FROM {table}
+    WHERE match_id IN ({match_filter_sql})
+    ORDER BY match_id, side, position
+    ''', params)
+
+    rosters = {}
+    for row in cursor.fetchall():
+        teams = rosters.setdefault(row['match_id'], {'team1': [], 'team2': []})
+        teams[f"team{row['side']}"].append({
+            'player_id': row['player_id'],
+            'name': row['player_name']
+        })
+    return rosters
+
+
+def attach_roster(cursor, match_data, table='match_roster'):
+    """Add team1/team2 lists to a single match dict"""
+    rosters = fetch_rosters(cursor, '?', (match_data['id'],), table)
+    match_data.update(rosters.get(match_data['id'], {'team1': [], 'team2': []}))
+    return match_data
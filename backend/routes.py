@@ -1,8 +1,19 @@
 from flask import Flask, jsonify, request, session
 from flask_cors import CORS
 from datetime import datetime, timedelta
+from functools import wraps
 import json
+import os
 from db import get_db_connection, init_db
+from roster import attach_roster, fetch_rosters, save_roster, team_label, teams_for_update, teams_from_request
+import analytics
+import archive
+import backup
+import brackets
+import cache
+import ratings
+import scheduler
+import usage
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
@@ -10,6 +21,129 @@ app.config['SECRET_KEY'] = 'your-secret-key-here'  # Change this in production!
 
 # Initialize database on startup
 init_db()
+archive.sync_schema()
+backup.enable_wal()
+
+def invalidate_match_caches():
+    """Drop cached schedules and bracket state after a match changes"""
+    scheduler.invalidate()
+    brackets.invalidate()
+    cache.invalidate()
+
+def rate_limit_response():
+    """429 response if the client is over its request budget, else None"""
+    retry_after = cache.allow_request(request.remote_addr)
+    if not retry_after:
+        return None
+    response = jsonify({'error': 'Too many requests'})
+    response.headers['Retry-After'] = str(max(1, round(retry_after)))
+    return response, 429
+
+def cached_response(when=None):
+    """Serve a view from the short-TTL cache, keyed on path and sorted query args.
+    
+    Identical requests arriving together share one run of the view; `when`
+    limits caching to the requests it returns True for. Only requests that
+    actually run the view count against the client's rate limit, so cache
+    hits stay free for spectators sharing one address.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if when is not None and not when():
+                return rate_limit_response() or view(*args, **kwargs)
+            
+            key = (request.path, tuple(sorted(
+                (name, value) for name, value in request.args.items(multi=True) if value != ''
+            )))
+            if not cache.is_warm(key):
+                limited = rate_limit_response()
+                if limited:
+                    return limited
+            
+            def render():
+                response = app.make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, response.mimetype
+            
+            body, status, mimetype = cache.get_or_compute(key, render)
+            return app.response_class(body, status=status, mimetype=mimetype)
+        return wrapper
+    return decorator
+
+def expected_match_version():
+    """Version the client last read: an int, None for no check, or False if malformed"""
+    expected = (request.get_json(silent=True) or {}).get('version')
+    if expected is None:
+        header = request.headers.get('If-Match', '').strip()
+        # '*' matches any current version, so it is the same as not checking
+        if not header or header == '*':
+            return None
+        expected = header[2:] if header.startswith('W/') else header
+        expected = expected.strip('"')
+    if isinstance(expected, bool):
+        return False
+    try:
+        return int(expected)
+    except (TypeError, ValueError):
+        return False
+
+def claim_match_version(cursor, match_id):
+    """Bump a match's version before changing it.
+    
+    Editors send the version they last read (JSON 'version' or an If-Match
+    header); if someone else has changed the match since, nothing is
+    updated and None is returned. The UPDATE also takes SQLite's write lock,
+    so the read-then-write that follows cannot interleave with other edits.
+    Archived matches, missing matches and malformed versions also return
+    None; version_conflict() tells them apart.
+    """
+    expected = expected_match_version()
+    if expected is False:
+        return None
+    
+    query = 'UPDATE match SET version = version + 1 WHERE id = ?'
+    params = [match_id]
+    if expected is not None:
+        query += ' AND version = ?'
+        params.append(expected)
+    cursor.execute(query, params)
+    
+    if cursor.rowcount == 0:
+        return None
+    cursor.execute('SELECT version FROM match WHERE id = ?', (match_id,))
+    return cursor.fetchone()[0]
+
+def version_conflict(conn, match_id):
+    """Error response for a failed claim_match_version: 400, 404 or 409 with the current state"""
+    conn.rollback()
+    
+    if expected_match_version() is False:
+        return jsonify({
+            'success': False,
+            'message': 'Version must be an integer (JSON "version" or an If-Match header)'
+        }), 400
+    
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM match WHERE id = ?', (match_id,))
+    if not cursor.fetchone():
+        archived, _ = archive.find_match(conn, match_id)
+        if archived:
+            return jsonify({'success': False, 'message': 'Match is archived and read-only'}), 400
+        return jsonify({'error': 'Match not found'}), 404
+    
+    return jsonify({
+        'success': False,
+        'message': 'Match was changed by another editor',
+        'current': load_match_details(conn, match_id)
+    }), 409
+
+def pending_response(conn):
+    """400 for play on a bracket match whose sides are not decided yet"""
+    conn.rollback()
+    return jsonify({
+        'success': False,
+        'message': 'Match is waiting for earlier bracket results'
+    }), 400
 
 # ============================================================================
 # AUTHENTICATION ROUTES
@@ -55,6 +189,7 @@ def check_auth():
 # ============================================================================
 
 @app.route('/api/matches', methods=['GET'])
+@cached_response(when=lambda: request.args.get('status') == 'live')
 def get_matches():
     """Get all matches with optional filtering and sorting"""
     status = request.args.get('status')  # live, completed, scheduled
@@ -64,46 +199,57 @@ def get_matches():
     search = request.args.get('search', '').lower()
     sort_by = request.args.get('sort_by', 'end_time')  # end_time, scheduled_date
     sort_order = request.args.get('sort_order', 'desc')  # asc, desc
+    player_id = request.args.get('player_id', type=int)
     
     with get_db_connection() as conn:
         cursor = conn.cursor()
         
-        # Base query
-        query = '''
-        SELECT m.* FROM match m
-        WHERE 1=1
-        '''
+        # Only completed matches are archived, so live views stay on the hot tables
+        suffix = ''
+        if status not in ('live', 'scheduled', 'pending'):
+            suffix = archive.attach(conn)
+        
+        # Base filter shared by the match, score and roster queries
+        where = 'WHERE 1=1'
         params = []
         
         # Apply filters
         if status:
-            query += ' AND m.status = ?'
+            where += ' AND m.status = ?'
             params.append(status)
         
         # Court filter
         if court and court != 'all':
-            query += ' AND m.court = ?'
+            where += ' AND m.court = ?'
             params.append(court)
         
         # Date filter
         if date:
-            query += ' AND m.date = ?'
+            where += ' AND m.date = ?'
             params.append(date)
         
         # Event type filter
         if event_type and event_type != 'all':
-            query += ' AND m.event_type = ?'
+            where += ' AND m.event_type = ?'
             params.append(event_type)
         
-        # Search filter
+        # Player filter (indexed roster lookup)
+        if player_id:
+            where += f' AND m.id IN (SELECT match_id FROM match_roster{suffix} WHERE player_id = ?)'
+            params.append(player_id)
+        
+        # Search filter (covers every doubles partner via the roster)
         if search:
-            query += ''' AND (
+            where += f''' AND (
                 LOWER(m.player1) LIKE ? OR 
                 LOWER(m.player2) LIKE ? OR 
-                LOWER(m.match_number) LIKE ?
+                LOWER(m.match_number) LIKE ? OR
+                m.id IN (SELECT match_id FROM match_roster{suffix} WHERE LOWER(player_name) LIKE ?)
             )'''
             search_param = f'%{search}%'
-            params.extend([search_param, search_param, search_param])
+            params.extend([search_param, search_param, search_param, search_param])
+        
+        query = f'SELECT m.* FROM match{suffix} m {where}'
         
         # Apply sorting
         sort_column = {
@@ -124,28 +270,29 @@ def get_matches():
         print(f"With params: {params}")
         
         cursor.execute(query, params)
-        matches = []
+        matches = [dict(row) for row in cursor.fetchall()]
         
-        for row in cursor.fetchall():
-            match = dict(row)
-            # Get scores for this match
-            cursor.execute('''
-            SELECT set_number, player1_score, player2_score, completed
-            FROM score WHERE match_id = ? ORDER BY set_number
-            ''', (match['id'],))
-            
-            scores = []
-            for score_row in cursor.fetchall():
-                score = dict(score_row)
-                scores.append({
-                    'set_number': score['set_number'],
-                    'player1_score': score['player1_score'],
-                    'player2_score': score['player2_score'],
-                    'completed': bool(score['completed'])
-                })
-            
-            match['scores'] = scores
-            matches.append(match)
+        # Load scores and rosters for all listed matches in one query each
+        match_ids_sql = f'SELECT m.id FROM match{suffix} m {where}'
+        cursor.execute(f'''
+        SELECT match_id, set_number, player1_score, player2_score, completed
+        FROM score{suffix} WHERE match_id IN ({match_ids_sql}) ORDER BY match_id, set_number
+        ''', params)
+        
+        scores_by_match = {}
+        for score_row in cursor.fetchall():
+            scores_by_match.setdefault(score_row['match_id'], []).append({
+                'set_number': score_row['set_number'],
+                'player1_score': score_row['player1_score'],
+                'player2_score': score_row['player2_score'],
+                'completed': bool(score_row['completed'])
+            })
+        
+        rosters = fetch_rosters(cursor, match_ids_sql, params, f'match_roster{suffix}')
+        
+        for match in matches:
+            match['scores'] = scores_by_match.get(match['id'], [])
+            match.update(rosters.get(match['id'], {'team1': [], 'team2': []}))
         
         # Debug logging
         print(f"Found {len(matches)} matches")
@@ -161,6 +308,10 @@ def create_match():
         cursor = conn.cursor()
         
         try:
+            teams = teams_from_request(cursor, data)
+            if not teams[1] or not teams[2]:
+                raise ValueError('Both sides need at least one player')
+            
             cursor.execute('''
             INSERT INTO match (
                 event_type, match_number, date, time, court, umpire, service_judge,
@@ -172,10 +323,12 @@ def create_match():
                 data['court'], data.get('umpire'), data.get('service_judge'),
                 data.get('max_points', 21), data.get('total_sets', 3), 
                 data.get('deuce_enabled', True),
-                data['player1'], data['player2']
+                data.get('player1') or team_label(teams[1]),
+                data.get('player2') or team_label(teams[2])
             ))
             
             match_id = cursor.lastrowid
+            save_roster(cursor, match_id, teams)
             
             # Initialize scores for each set
             for i in range(1, data.get('total_sets', 3) + 1):
@@ -185,6 +338,7 @@ def create_match():
                 ''', (match_id, i))
             
             conn.commit()
+            invalidate_match_caches()
             
             return jsonify({
                 'success': True,
@@ -198,30 +352,40 @@ def create_match():
                 'message': f'Error creating match: {str(e)}'
             }), 400
 
+def load_match_details(conn, match_id):
+    """Match row with scores, roster and analytics, or None if it does not exist"""
+    cursor = conn.cursor()
+    
+    # Get match details (archived matches are read from the archive)
+    match, suffix = archive.find_match(conn, match_id)
+    
+    if not match:
+        return None
+    
+    match_data = dict(match)
+    
+    # Get scores
+    cursor.execute(f'''
+    SELECT set_number, player1_score, player2_score, completed, updated_at
+    FROM score{suffix} WHERE match_id = ? ORDER BY set_number
+    ''', (match_id,))
+    
+    scores = [dict(row) for row in cursor.fetchall()]
+    match_data['scores'] = scores
+    attach_roster(cursor, match_data, f'match_roster{suffix}')
+    match_data['analytics'] = analytics.match_analytics(cursor, match_data, f'rally{suffix}')
+    
+    return match_data
+
 @app.route('/api/matches/<int:match_id>', methods=['GET'])
 def get_match(match_id):
     """Get specific match details"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Get match details
-        cursor.execute('SELECT * FROM match WHERE id = ?', (match_id,))
-        match = cursor.fetchone()
+        match_data = load_match_details(conn, match_id)
         
-        if not match:
+        if not match_data:
             return jsonify({'error': 'Match not found'}), 404
         
-        match_data = dict(match)
-        
-        # Get scores
-        cursor.execute('''
-        SELECT set_number, player1_score, player2_score, completed, updated_at
-        FROM score WHERE match_id = ? ORDER BY set_number
-        ''', (match_id,))
-        
-        scores = [dict(row) for row in cursor.fetchall()]
-        match_data['scores'] = scores
-        
         return jsonify(match_data)
 
 @app.route('/api/matches/<int:match_id>', methods=['PUT'])
@@ -233,10 +397,22 @@ def update_match(match_id):
         cursor = conn.cursor()
         
         try:
+            version = claim_match_version(cursor, match_id)
+            if version is None:
+                return version_conflict(conn, match_id)
+            
             # Build dynamic update query
             update_fields = []
             params = []
             
+            # Replace the roster for any side whose players changed
+            teams = teams_for_update(cursor, match_id, data)
+            for side, team in teams.items():
+                if not team:
+                    raise ValueError('Both sides need at least one player')
+                if f'player{side}' not in data:
+                    data[f'player{side}'] = team_label(team)
+            
             for field in ['event_type', 'match_number', 'date', 'time', 'court', 
                         'umpire', 'service_judge', 'max_points', 'total_sets', 
                         'deuce_enabled', 'player1', 'player2', 'status', 
@@ -245,13 +421,19 @@ def update_match(match_id):
                     update_fields.append(f'{field} = ?')
                     params.append(data[field])
             
+            if 'shuttles_used' in data:
+                usage.record_shuttles(cursor, match_id, data['shuttles_used'])
+            
             if update_fields:
                 params.append(match_id)
                 query = f'UPDATE match SET {", ".join(update_fields)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?'
                 cursor.execute(query, params)
-                conn.commit()
             
-            return jsonify({'success': True, 'message': 'Match updated successfully'})
+            save_roster(cursor, match_id, teams)
+            conn.commit()
+            invalidate_match_caches()
+            
+            return jsonify({'success': True, 'message': 'Match updated successfully', 'version': version})
         except Exception as e:
             conn.rollback()
             return jsonify({
@@ -266,12 +448,21 @@ def delete_match(match_id):
         cursor = conn.cursor()
         
         try:
-            # Delete scores first (foreign key constraint)
+            version = claim_match_version(cursor, match_id)
+            if version is None:
+                return version_conflict(conn, match_id)
+            
+            # Delete dependent rows first (foreign key constraint)
             cursor.execute('DELETE FROM score WHERE match_id = ?', (match_id,))
+            cursor.execute('DELETE FROM match_roster WHERE match_id = ?', (match_id,))
+            cursor.execute('DELETE FROM bracket_slot WHERE match_id = ?', (match_id,))
+            cursor.execute('DELETE FROM rally WHERE match_id = ?', (match_id,))
+            usage.forget_match(cursor, match_id)
             # Delete match
             cursor.execute('DELETE FROM match WHERE id = ?', (match_id,))
             
             conn.commit()
+            invalidate_match_caches()
             return jsonify({'success': True, 'message': 'Match deleted successfully'})
         except Exception as e:
             conn.rollback()
@@ -291,14 +482,23 @@ def start_match(match_id):
         cursor = conn.cursor()
         
         try:
-            start_time = datetime.now().isoformat()
+            version = claim_match_version(cursor, match_id)
+            if version is None:
+                return version_conflict(conn, match_id)
+            if brackets.is_pending(cursor, match_id):
+                return pending_response(conn)
+            
+            started = datetime.now()
+            start_time = started.isoformat()
+            usage.record_start(cursor, match_id, started)
             cursor.execute('''
             UPDATE match SET status = 'live', start_time = ?, current_set = 1,
             updated_at = CURRENT_TIMESTAMP WHERE id = ?
             ''', (start_time, match_id))
             
             conn.commit()
-            return jsonify({'success': True, 'start_time': start_time})
+            invalidate_match_caches()
+            return jsonify({'success': True, 'start_time': start_time, 'version': version})
         except Exception as e:
             conn.rollback()
             return jsonify({
@@ -313,6 +513,12 @@ def end_match(match_id):
         cursor = conn.cursor()
         
         try:
+            version = claim_match_version(cursor, match_id)
+            if version is None:
+                return version_conflict(conn, match_id)
+            if brackets.is_pending(cursor, match_id):
+                return pending_response(conn)
+            
             # Get start time to calculate duration
             cursor.execute('SELECT start_time FROM match WHERE id = ?', (match_id,))
             result = cursor.fetchone()
@@ -349,16 +555,21 @@ def end_match(match_id):
                 ''', (p1_score, p2_score, match_id, current_set))
             
             # Update match status
+            usage.record_end(cursor, match_id, end_time)
             cursor.execute('''
             UPDATE match SET status = 'completed', end_time = ?, duration = ?,
             updated_at = CURRENT_TIMESTAMP WHERE id = ?
             ''', (end_time.isoformat(), duration, match_id))
             
+            ratings.record_match(cursor, match_id)
+            brackets.advance(cursor, match_id)
             conn.commit()
+            invalidate_match_caches()
             return jsonify({
                 'success': True,
                 'end_time': end_time.isoformat(),
-                'duration': duration
+                'duration': duration,
+                'version': version
             })
         except Exception as e:
             conn.rollback()
@@ -374,6 +585,12 @@ def end_match_abruptly(match_id):
         cursor = conn.cursor()
 
         try:
+            version = claim_match_version(cursor, match_id)
+            if version is None:
+                return version_conflict(conn, match_id)
+            if brackets.is_pending(cursor, match_id):
+                return pending_response(conn)
+
             # Get match details and current set scores
             cursor.execute('''
             SELECT m.start_time, m.current_set, m.total_sets, m.max_points,
@@ -440,17 +657,22 @@ def end_match_abruptly(match_id):
                 duration = f"{int(hours)}h {int(minutes)}m"
 
             # Update match status to completed
+            usage.record_end(cursor, match_id, end_time)
             cursor.execute('''
             UPDATE match SET status = 'completed', end_time = ?, duration = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
             ''', (end_time.isoformat(), duration, match_id))
 
+            ratings.record_match(cursor, match_id)
+            brackets.advance(cursor, match_id)
             conn.commit()
+            invalidate_match_caches()
             return jsonify({
                 'success': True,
                 'message': 'Match ended abruptly',
                 'end_time': end_time.isoformat(),
-                'duration': duration
+                'duration': duration,
+                'version': version
             })
         except Exception as e:
             conn.rollback()
@@ -471,6 +693,12 @@ def update_score(match_id):
         cursor = conn.cursor()
         
         try:
+            version = claim_match_version(cursor, match_id)
+            if version is None:
+                return version_conflict(conn, match_id)
+            if brackets.is_pending(cursor, match_id):
+                return pending_response(conn)
+            
             # Get current score
             cursor.execute('''
             SELECT player1_score, player2_score, completed FROM score
@@ -521,12 +749,22 @@ def update_score(match_id):
             WHERE match_id = ? AND set_number = ?
             ''', (p1_score, p2_score, set_completed, match_id, set_number))
             
+            # Log the rally for momentum analytics
+            cursor.execute('''
+            INSERT INTO rally (match_id, set_number, player, action, player1_score, player2_score)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (match_id, set_number, 1 if player == 1 else 2, action, p1_score, p2_score))
+            
+            bracket_id = brackets.bracket_of(cursor, match_id)
             conn.commit()
+            if bracket_id:
+                brackets.invalidate(bracket_id)
             return jsonify({
                 'success': True,
                 'player1_score': p1_score,
                 'player2_score': p2_score,
-                'completed': set_completed
+                'completed': set_completed,
+                'version': version
             })
         except Exception as e:
             conn.rollback()
@@ -542,6 +780,12 @@ def next_set(match_id):
         cursor = conn.cursor()
         
         try:
+            version = claim_match_version(cursor, match_id)
+            if version is None:
+                return version_conflict(conn, match_id)
+            if brackets.is_pending(cursor, match_id):
+                return pending_response(conn)
+            
             cursor.execute('SELECT current_set, total_sets FROM match WHERE id = ?', (match_id,))
             current_set, total_sets = cursor.fetchone()
             
@@ -551,7 +795,7 @@ def next_set(match_id):
                 WHERE id = ?
                 ''', (current_set + 1, match_id))
                 conn.commit()
-                return jsonify({'success': True, 'current_set': current_set + 1})
+                return jsonify({'success': True, 'current_set': current_set + 1, 'version': version})
             
             return jsonify({'error': 'Already at final set'}), 400
         except Exception as e:
@@ -561,6 +805,105 @@ def next_set(match_id):
                 'message': f'Error moving to next set: {str(e)}'
             }), 400
 
+# ============================================================================
+# COURT SCHEDULING ROUTES
+# ============================================================================
+
+@app.route('/api/schedule', methods=['GET'])
+def get_schedule():
+    """Get the planned court assignment and order for a day, plus conflicts"""
+    date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+    return jsonify(scheduler.get_schedule(date))
+
+@app.route('/api/schedule/next', methods=['GET'])
+def get_next_matches():
+    """Get the next match to play on each court"""
+    date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+    schedule = scheduler.get_schedule(date)
+    return jsonify({
+        'date': date,
+        'next_matches': scheduler.next_matches(schedule)
+    })
+
+@app.route('/api/schedule/apply', methods=['POST'])
+def apply_schedule():
+    """Write the planned courts and start times back to the scheduled matches"""
+    data = request.json or {}
+    date = data.get('date', datetime.now().strftime('%Y-%m-%d'))
+    schedule = scheduler.get_schedule(date)
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+            UPDATE match SET court = ?, time = ?, version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'scheduled'
+            ''', [(entry['court'], entry['estimated_start'], entry['match_id'])
+                  for entry in schedule['plan']])
+            
+            conn.commit()
+            invalidate_match_caches()
+            # Matches that would run past midnight keep their stored court and time
+            return jsonify({
+                'success': True,
+                'updated': len(schedule['plan']),
+                'not_applied': [entry['match_id'] for entry in schedule['overflow']]
+            })
+        except Exception as e:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'message': f'Error applying schedule: {str(e)}'
+            }), 400
+
+# ============================================================================
+# BRACKET ROUTES
+# ============================================================================
+
+@app.route('/api/brackets', methods=['GET'])
+def get_brackets():
+    """Get all brackets"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM bracket ORDER BY created_at DESC, id DESC')
+        return jsonify([dict(row) for row in cursor.fetchall()])
+
+@app.route('/api/brackets', methods=['POST'])
+def create_bracket():
+    """Generate a seeded knockout or round-robin draw with all its matches"""
+    data = request.json
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        try:
+            bracket_id = brackets.create_bracket(cursor, data)
+            conn.commit()
+            invalidate_match_caches()
+            
+            return jsonify({
+                'success': True,
+                'bracket_id': bracket_id,
+                'message': 'Bracket created successfully'
+            })
+        except Exception as e:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'message': f'Error creating bracket: {str(e)}'
+            }), 400
+
+@app.route('/api/brackets/<int:bracket_id>', methods=['GET'])
+def get_bracket(bracket_id):
+    """Get bracket rounds, results and standings"""
+    state = brackets.get_bracket(bracket_id)
+    
+    if not state:
+        return jsonify({'error': 'Bracket not found'}), 404
+    
+    return jsonify(state)
+
 # ============================================================================
 # PLAYER MANAGEMENT ROUTES
 # ============================================================================
@@ -657,11 +1000,62 @@ def delete_player(player_id):
                 'message': f'Error deleting player: {str(e)}'
             }), 400
 
+@app.route('/api/players/<int:player_id>/stats', methods=['GET'])
+def get_player_stats(player_id):
+    """Get singles and doubles results for a player"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM player WHERE id = ?', (player_id,))
+        player = cursor.fetchone()
+        
+        if not player:
+            return jsonify({'error': 'Player not found'}), 404
+        
+        suffix = archive.attach(conn)
+        
+        # Sets won per side for every completed match the player was rostered in
+        cursor.execute(f'''
+        SELECT r.side, m.event_type,
+               COALESCE(SUM(CASE WHEN s.player1_score > s.player2_score THEN 1 ELSE 0 END), 0) AS side1_sets,
+               COALESCE(SUM(CASE WHEN s.player2_score > s.player1_score THEN 1 ELSE 0 END), 0) AS side2_sets,
+               SUM(CASE WHEN r.side = 1 THEN s.player1_score ELSE s.player2_score END) AS points_for,
+               SUM(CASE WHEN r.side = 1 THEN s.player2_score ELSE s.player1_score END) AS points_against
+        FROM match_roster{suffix} r
+        JOIN match{suffix} m ON m.id = r.match_id AND m.status = 'completed'
+        LEFT JOIN score{suffix} s ON s.match_id = m.id AND s.completed = 1
+        WHERE r.player_id = ?
+        GROUP BY m.id
+        ''', (player_id,))
+        
+        stats = {'played': 0, 'won': 0, 'lost': 0, 'drawn': 0, 'points_for': 0, 'points_against': 0}
+        by_event = {}
+        for row in cursor.fetchall():
+            own_sets = row['side1_sets'] if row['side'] == 1 else row['side2_sets']
+            other_sets = row['side2_sets'] if row['side'] == 1 else row['side1_sets']
+            result = 'won' if own_sets > other_sets else 'lost' if own_sets < other_sets else 'drawn'
+            
+            event_stats = by_event.setdefault(row['event_type'], {'played': 0, 'won': 0, 'lost': 0, 'drawn': 0})
+            for totals in (stats, event_stats):
+                totals['played'] += 1
+                totals[result] += 1
+            stats['points_for'] += row['points_for'] or 0
+            stats['points_against'] += row['points_against'] or 0
+        
+        stats['win_rate'] = stats['won'] / stats['played'] if stats['played'] > 0 else 0
+        
+        return jsonify({
+            'player': dict(player),
+            'stats': stats,
+            'event_breakdown': by_event
+        })
+
 # ============================================================================
 # STATISTICS AND ANALYTICS ROUTES
 # ============================================================================
 
 @app.route('/api/stats/dashboard', methods=['GET'])
+@cached_response()
 def get_dashboard_stats():
     """Get dashboard statistics"""
     with get_db_connection() as conn:
@@ -680,8 +1074,9 @@ def get_dashboard_stats():
         cursor.execute("SELECT COUNT(DISTINCT court) FROM match WHERE status = 'live'")
         active_courts = cursor.fetchone()[0]
         
-        # Average match duration
-        cursor.execute("""
+        # Average match duration (across archived seasons too)
+        suffix = archive.attach(conn)
+        cursor.execute(f"""
         SELECT AVG(
             CASE 
                 WHEN duration IS NOT NULL AND duration != '' 
@@ -689,7 +1084,7 @@ def get_dashboard_stats():
                      CAST(SUBSTR(duration, INSTR(duration, 'h')+2, INSTR(duration, 'm')-INSTR(duration, 'h')-2) AS INTEGER)
                 ELSE NULL 
             END
-        ) FROM match WHERE status = 'completed' AND duration IS NOT NULL
+        ) FROM match{suffix} WHERE status = 'completed' AND duration IS NOT NULL
         """)
         avg_duration_minutes = cursor.fetchone()[0]
         avg_duration = f"{int(avg_duration_minutes)}m" if avg_duration_minutes else "N/A"
@@ -708,9 +1103,10 @@ def get_match_stats():
     date_to = request.args.get('date_to')
     
     with get_db_connection() as conn:
+        suffix = archive.attach(conn)
         cursor = conn.cursor()
         
-        query = "SELECT * FROM match WHERE status = 'completed'"
+        query = f"SELECT * FROM match{suffix} WHERE status = 'completed'"
         params = []
         
         if date_from:
@@ -730,7 +1126,7 @@ def get_match_stats():
         # Event type distribution
         cursor.execute(f"""
         SELECT event_type, COUNT(*) as count 
-        FROM match WHERE status = 'completed'
+        FROM match{suffix} WHERE status = 'completed'
         {' AND date >= ?' if date_from else ''}
         {' AND date <= ?' if date_to else ''}
         GROUP BY event_type
@@ -745,6 +1141,68 @@ def get_match_stats():
             'avg_shuttles_per_match': total_shuttles / total_matches if total_matches > 0 else 0
         })
 
+@app.route('/api/stats/usage', methods=['GET'])
+def get_usage_stats():
+    """Get shuttle use and court utilization per hour or day and per court"""
+    granularity = request.args.get('granularity', 'day')  # hour, day
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    court = request.args.get('court')
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        try:
+            return jsonify(usage.usage_stats(cursor, granularity, date_from, date_to, court))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+@app.route('/api/stats/usage/rebuild', methods=['POST'])
+def rebuild_usage_stats():
+    """Backfill usage events for older matches and rebuild the rollups"""
+    with get_db_connection() as conn:
+        suffix = archive.attach(conn)
+        cursor = conn.cursor()
+        
+        try:
+            result = usage.rebuild(cursor, suffix)
+            conn.commit()
+            return jsonify({'success': True, **result})
+        except Exception as e:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'message': f'Error rebuilding usage stats: {str(e)}'
+            }), 400
+
+@app.route('/api/ratings/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Get players ranked by rating"""
+    limit = request.args.get('limit', 50, type=int)
+    min_matches = request.args.get('min_matches', 0, type=int)
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        return jsonify(ratings.leaderboard(cursor, limit, min_matches))
+
+@app.route('/api/ratings/recompute', methods=['POST'])
+def recompute_ratings():
+    """Rebuild all ratings from the completed match history"""
+    with get_db_connection() as conn:
+        suffix = archive.attach(conn)
+        cursor = conn.cursor()
+        
+        try:
+            replayed = ratings.recompute_all(cursor, suffix)
+            conn.commit()
+            return jsonify({'success': True, 'matches_replayed': replayed})
+        except Exception as e:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'message': f'Error recomputing ratings: {str(e)}'
+            }), 400
+
 # ============================================================================
 # SYSTEM SETTINGS ROUTES
 # ============================================================================
@@ -776,6 +1234,7 @@ def update_settings():
                 ''', (key, str(value)))
             
             conn.commit()
+            invalidate_match_caches()
             return jsonify({'success': True, 'message': 'Settings updated successfully'})
         except Exception as e:
             conn.rollback()
@@ -784,6 +1243,70 @@ def update_settings():
                 'message': f'Error updating settings: {str(e)}'
             }), 400
 
+# ============================================================================
+# ARCHIVE ROUTES
+# ============================================================================
+
+@app.route('/api/archive', methods=['POST'])
+def archive_matches():
+    """Move old completed matches out of the live tables into the archive"""
+    data = request.json or {}
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        try:
+            result = archive.archive_matches(conn, data.get('older_than_days'))
+            conn.commit()
+            
+            # Give the freed pages back to the filesystem
+            if data.get('vacuum'):
+                cursor.execute('VACUUM main')
+            
+            invalidate_match_caches()
+            return jsonify({'success': True, **result})
+        except Exception as e:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'message': f'Error archiving matches: {str(e)}'
+            }), 400
+
+# ============================================================================
+# BACKUP ROUTES
+# ============================================================================
+
+@app.route('/api/backups', methods=['GET'])
+def get_backups():
+    """List database snapshots"""
+    return jsonify(backup.list_snapshots())
+
+@app.route('/api/backups', methods=['POST'])
+def create_backup():
+    """Take a point-in-time snapshot of the database"""
+    data = request.json or {}
+    
+    try:
+        return jsonify({'success': True, **backup.create_snapshot(data.get('label', 'manual'))})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error creating backup: {str(e)}'
+        }), 400
+
+@app.route('/api/backups/<name>/restore', methods=['POST'])
+def restore_backup(name):
+    """Restore the database from a snapshot"""
+    try:
+        result = backup.restore_snapshot(name)
+        invalidate_match_caches()
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error restoring backup: {str(e)}'
+        }), 400
+
 # ============================================================================
 # EXPORT ROUTES
 # ============================================================================
@@ -794,22 +1317,22 @@ def export_match(match_id):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         
-        # Get complete match data
-        cursor.execute('SELECT * FROM match WHERE id = ?', (match_id,))
-        match = cursor.fetchone()
+        # Get complete match data (archived matches are read from the archive)
+        match, suffix = archive.find_match(conn, match_id)
         
         if not match:
             return jsonify({'error': 'Match not found'}), 404
         
         match_data = dict(match)
         
-        cursor.execute('''
+        cursor.execute(f'''
         SELECT set_number, player1_score, player2_score, completed
-        FROM score WHERE match_id = ? ORDER BY set_number
+        FROM score{suffix} WHERE match_id = ? ORDER BY set_number
         ''', (match_id,))
         
         scores = [dict(row) for row in cursor.fetchall()]
         match_data['scores'] = scores
+        attach_roster(cursor, match_data, f'match_roster{suffix}')
         
         return jsonify({
             'match_data': match_data,
@@ -818,4 +1341,7 @@ def export_match(match_id):
         })
 
 if __name__ == '__main__':
+    # The reloader runs this file twice; only its child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        backup.start_scheduler()
     app.run(debug=True, port=5328, host='0.0.0.0')
\ No newline at end of file
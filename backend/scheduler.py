@@ -0,0 +1,275 @@
+import heapq
+import threading
+import time
+from datetime import datetime
+
+from db import get_db_connection, get_setting
+from roster import player_key
+
+DEFAULT_MATCH_MINUTES = 30
+DEFAULT_REST_MINUTES = 20
+MINUTES_PER_DAY = 24 * 60
+
+# Today's plan starts from the current time, so it goes stale on its own
+TODAY_CACHE_SECONDS = 60
+
+_plan_cache = {}
+_plan_lock = threading.Lock()
+
+
+def _to_minutes(value):
+    """Minutes since midnight for 'HH:MM' or ISO datetime strings"""
+    if not value:
+        return None
+    try:
+        if 'T' in value or ' ' in value.strip():
+            parsed = datetime.fromisoformat(value)
+            return parsed.hour * 60 + parsed.minute
+        hours, minutes = value.split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except ValueError:
+        return None
+
+
+def _format_minutes(minutes):
+    """'HH:MM' for minutes since midnight"""
+    return f'{int(minutes) // 60:02d}:{int(minutes) % 60:02d}'
+
+
+def _duration_minutes(duration):
+    """Minutes for a stored duration string like '1h 5m'"""
+    try:
+        hours, rest = duration.split('h')
+        return int(hours) * 60 + int(rest.strip().rstrip('m') or 0)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _estimated_durations(cursor, fallback):
+    """Average completed match length per event type, in minutes"""
+    cursor.execute('''
+    SELECT event_type, duration FROM match
+    WHERE status = 'completed' AND duration IS NOT NULL AND duration != ''
+    ''')
+    totals = {}
+    for event_type, duration in cursor.fetchall():
+        minutes = _duration_minutes(duration)
+        if minutes:
+            total, count = totals.get(event_type, (0, 0))
+            totals[event_type] = (total + minutes, count + 1)
+    estimates = {event: total / count for event, (total, count) in totals.items()}
+    default = sum(estimates.values()) / len(estimates) if estimates else fallback
+    return estimates, default
+
+
+def load_day(cursor, date):
+    """Load the day's matches with their player keys and scheduling settings"""
+    courts = [c.strip() for c in get_setting(cursor, 'default_courts', '').split(',') if c.strip()]
+    rest = get_setting(cursor, 'min_rest_minutes', DEFAULT_REST_MINUTES, int)
+    fallback = get_setting(cursor, 'default_match_minutes', DEFAULT_MATCH_MINUTES, int)
+    estimates, default_duration = _estimated_durations(cursor, fallback)
+
+    cursor.execute('''
+    SELECT id, event_type, match_number, time, court, status, start_time, end_time
+    FROM match WHERE date = ? ORDER BY time, match_number, id
+    ''', (date,))
+    matches = [dict(row) for row in cursor.fetchall()]
+
+    cursor.execute('''
+    SELECT r.match_id, r.player_id, r.player_name FROM match_roster r
+    JOIN match m ON m.id = r.match_id WHERE m.date = ?
+    ''', (date,))
+    players = {}
+    for match_id, player_id, player_name in cursor.fetchall():
+        players.setdefault(match_id, set()).add(player_key(player_id, player_name))
+
+    for match in matches:
+        match['players'] = players.get(match['id'], set())
+        match['duration'] = estimates.get(match['event_type'], default_duration)
+
+    if not courts:
+        courts = sorted({m['court'] for m in matches if m['court']})
+
+    return matches, courts, rest
+
+
+def build_schedule(matches, courts, rest, day_start=None):
+    """Assign pending matches to courts and order them.
+
+    Greedy list scheduling: whenever a court frees up it takes the pending
+    match (in scheduled-time order) that can start soonest, where a match can
+    only start once all of its players have finished their previous match and
+    rested. Live and completed matches pin their players and courts.
+    
+    Returns (plan, overflow); matches that would run past midnight go into
+    overflow and take no court time.
+    """
+    pending = [m for m in matches if m['status'] == 'scheduled']
+    if not courts:
+        return [], []
+
+    scheduled_times = [_to_minutes(m['time']) for m in pending]
+    scheduled_times = [t for t in scheduled_times if t is not None]
+    if day_start is None:
+        day_start = min(scheduled_times) if scheduled_times else 0
+
+    court_free = {court: day_start for court in courts}
+    player_ready = {}
+
+    for match in matches:
+        if match['status'] == 'completed':
+            end = _to_minutes(match['end_time'])
+            if end is not None:
+                for player in match['players']:
+                    player_ready[player] = max(player_ready.get(player, 0), end + rest)
+        elif match['status'] == 'live':
+            start = _to_minutes(match['start_time'])
+            start = day_start if start is None else start
+            end = max(day_start, start + match['duration'])
+            if match['court'] in court_free:
+                court_free[match['court']] = max(court_free[match['court']], end)
+            for player in match['players']:
+                player_ready[player] = max(player_ready.get(player, 0), end + rest)
+
+    heap = [(free_at, index, court) for index, (court, free_at) in enumerate(court_free.items())]
+    heapq.heapify(heap)
+
+    plan = []
+    overflow = []
+    while pending:
+        free_at, index, court = heapq.heappop(heap)
+
+        best_index, best_start = None, None
+        for i, match in enumerate(pending):
+            start = max([free_at] + [player_ready.get(p, 0) for p in match['players']])
+            if best_start is None or start < best_start:
+                best_index, best_start = i, start
+            if start == free_at:
+                break
+
+        match = pending.pop(best_index)
+        end = best_start + match['duration']
+        if end > MINUTES_PER_DAY:
+            overflow.append({
+                'match_id': match['id'],
+                'match_number': match['match_number'],
+                'event_type': match['event_type']
+            })
+            heapq.heappush(heap, (free_at, index, court))
+            continue
+
+        for player in match['players']:
+            player_ready[player] = end + rest
+        heapq.heappush(heap, (end, index, court))
+
+        plan.append({
+            'match_id': match['id'],
+            'match_number': match['match_number'],
+            'event_type': match['event_type'],
+            'court': court,
+            'estimated_start': _format_minutes(best_start),
+            'estimated_end': _format_minutes(end),
+            'idle_minutes': int(best_start - free_at)
+        })
+
+    return plan, overflow
+
+
+def find_conflicts(matches, rest):
+    """Detect double-booked players and courts in the stored schedule"""
+    conflicts = []
+    # Matches without a court (such as fresh bracket fixtures) are not placed yet
+    active = [m for m in matches if m['status'] != 'completed' and m['court']
+              and _to_minutes(m['time']) is not None]
+
+    by_player = {}
+    by_court = {}
+    for match in active:
+        by_court.setdefault(match['court'], []).append(match)
+        for player in match['players']:
+            by_player.setdefault(player, []).append(match)
+
+    for player, player_matches in by_player.items():
+        player_matches.sort(key=lambda m: _to_minutes(m['time']))
+        for earlier, later in zip(player_matches, player_matches[1:]):
+            gap = _to_minutes(later['time']) - _to_minutes(earlier['time'])
+            if gap < earlier['duration']:
+                kind = 'player_overlap'
+            elif gap < earlier['duration'] + rest:
+                kind = 'insufficient_rest'
+            else:
+                continue
+            conflict = {'type': kind, 'match_ids': [earlier['id'], later['id']]}
+            key_type, value = player.split(':', 1)
+            if key_type == 'id':
+                conflict['player_id'] = int(value)
+            else:
+                conflict['player'] = value
+            conflicts.append(conflict)
+
+    for court, court_matches in by_court.items():
+        court_matches.sort(key=lambda m: _to_minutes(m['time']))
+        for earlier, later in zip(court_matches, court_matches[1:]):
+            if _to_minutes(later['time']) - _to_minutes(earlier['time']) < earlier['duration']:
+                conflicts.append({
+                    'type': 'court_overlap',
+                    'court': court,
+                    'match_ids': [earlier['id'], later['id']]
+                })
+
+    return conflicts
+
+
+def get_schedule(date):
+    """Cached schedule for a date, recomputed after invalidate() (today's also expires)"""
+    with _plan_lock:
+        cached = _plan_cache.get(date)
+        if cached and (cached[1] is None or cached[1] > time.monotonic()):
+            return cached[0]
+
+    with get_db_connection() as conn:
+        matches, courts, rest = load_day(conn.cursor(), date)
+
+    # Today's plan cannot start in the past
+    day_start = None
+    expires = None
+    now = datetime.now()
+    if date == now.strftime('%Y-%m-%d'):
+        expires = time.monotonic() + TODAY_CACHE_SECONDS
+        scheduled_times = [_to_minutes(m['time']) for m in matches if m['status'] == 'scheduled']
+        scheduled_times = [t for t in scheduled_times if t is not None]
+        day_start = now.hour * 60 + now.minute
+        if scheduled_times:
+            day_start = max(day_start, min(scheduled_times))
+
+    plan, overflow = build_schedule(matches, courts, rest, day_start)
+    schedule = {
+        'date': date,
+        'courts': courts,
+        'rest_minutes': rest,
+        'plan': plan,
+        'overflow': overflow,
+        'conflicts': find_conflicts(matches, rest)
+    }
+
+    with _plan_lock:
+        _plan_cache[date] = (schedule, expires)
+    return schedule
+
+
+def next_matches(schedule):
+    """First planned match for each court"""
+    upcoming = {court: None for court in schedule['courts']}
+    for entry in schedule['plan']:
+        if upcoming.get(entry['court']) is None:
+            upcoming[entry['court']] = entry
+    return upcoming
+
+
+def invalidate(date=None):
+    """Drop cached schedules so the next request sees fresh match state"""
+    with _plan_lock:
+        if date is None:
+            _plan_cache.clear()
+        else:
+            _plan_cache.pop(date, None)
@@ -0,0 +1,205 @@
+from datetime import datetime, timedelta
+
+# Rollup granularities: bucket label format and bucket length in seconds
+GRANULARITIES = {
+    'hour': ('%Y-%m-%dT%H', 3600),
+    'day': ('%Y-%m-%d', 86400)
+}
+
+
+def _bucket_start(moment, granularity):
+    """Start of the hour or day containing a moment"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _busy_by_bucket(start, end, granularity):
+    """Split an occupied interval into (bucket label, seconds) per bucket it spans"""
+    label, length = GRANULARITIES[granularity]
+    parts = []
+    current = start
+    while current < end:
+        bucket = _bucket_start(current, granularity)
+        bucket_end = min(end, bucket + timedelta(seconds=length))
+        parts.append((bucket.strftime(label), (bucket_end - current).total_seconds()))
+        current = bucket_end
+    return parts
+
+
+def _contributions(kind, court, moment, value):
+    """Rollup increments (granularity, bucket, court, shuttles, busy_seconds, matches) for one event"""
+    rows = []
+    for granularity, (label, _) in GRANULARITIES.items():
+        if kind == 'shuttle':
+            rows.append((granularity, moment.strftime(label), court, value, 0, 0))
+        elif kind == 'start':
+            rows.append((granularity, moment.strftime(label), court, 0, 0, 1))
+        elif kind == 'end':
+            start = moment - timedelta(seconds=value)
+            rows.extend((granularity, bucket, court, 0, seconds, 0)
+                        for bucket, seconds in _busy_by_bucket(start, moment, granularity))
+    return rows
+
+
+def _add_to_rollups(cursor, rows):
+    """Upsert rollup increments"""
+    cursor.executemany('''
+    INSERT INTO usage_rollup (granularity, bucket, court, shuttles, busy_seconds, matches)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket, court) DO UPDATE SET
+        shuttles = shuttles + excluded.shuttles,
+        busy_seconds = busy_seconds + excluded.busy_seconds,
+        matches = matches + excluded.matches
+    ''', rows)
+
+
+def _record(cursor, match_id, court, kind, moment, value):
+    """Append an event and fold it into the hourly and daily rollups"""
+    cursor.execute('''
+    INSERT INTO usage_event (match_id, court, kind, ts, value) VALUES (?, ?, ?, ?, ?)
+    ''', (match_id, court, kind, moment.isoformat(), value))
+    _add_to_rollups(cursor, _contributions(kind, court, moment, value))
+
+
+def record_shuttles(cursor, match_id, shuttles_used, moment=None):
+    """Log a change to a match's shuttle count; call before the match row is updated"""
+    cursor.execute('SELECT court, shuttles_used FROM match WHERE id = ?', (match_id,))
+    row = cursor.fetchone()
+    if not row:
+        return
+    delta = int(shuttles_used or 0) - int(row[1] or 0)
+    if delta:
+        _record(cursor, match_id, row[0], 'shuttle', moment or datetime.now(), delta)
+
+
+def record_start(cursor, match_id, moment):
+    """Log a court becoming occupied; call before the match is marked live"""
+    cursor.execute('SELECT court, status FROM match WHERE id = ?', (match_id,))
+    row = cursor.fetchone()
+    if row and row[1] != 'live':
+        _record(cursor, match_id, row[0], 'start', moment, 1)
+
+
+def record_end(cursor, match_id, moment):
+    """Log a court being freed with its occupied seconds; call before the match is marked completed"""
+    cursor.execute('SELECT court, status, start_time FROM match WHERE id = ?', (match_id,))
+    row = cursor.fetchone()
+    if not row or row[1] != 'live' or not row[2]:
+        return
+    busy_seconds = max(0, int((moment - datetime.fromisoformat(row[2])).total_seconds()))
+    _record(cursor, match_id, row[0], 'end', moment, busy_seconds)
+
+
+def forget_match(cursor, match_id):
+    """Remove a deleted match's events and take them back out of the rollups"""
+    cursor.execute('SELECT kind, court, ts, value FROM usage_event WHERE match_id = ?', (match_id,))
+    rows = []
+    for kind, court, ts, value in cursor.fetchall():
+        rows.extend((granularity, bucket, bucket_court, -shuttles, -busy, -matches)
+                    for granularity, bucket, bucket_court, shuttles, busy, matches
+                    in _contributions(kind, court, datetime.fromisoformat(ts), value))
+    if not rows:
+        return
+
+    _add_to_rollups(cursor, rows)
+    # Drop buckets the match was the only activity in
+    cursor.executemany('''
+    DELETE FROM usage_rollup
+    WHERE granularity = ? AND bucket = ? AND court = ?
+    AND shuttles = 0 AND matches = 0 AND ABS(busy_seconds) < 0.001
+    ''', {row[:3] for row in rows})
+    cursor.execute('DELETE FROM usage_event WHERE match_id = ?', (match_id,))
+
+
+def rebuild(cursor, suffix=''):
+    """Backfill events for finished matches that predate tracking, then rebuild every rollup"""
+    cursor.execute(f'''
+    SELECT id, court, start_time, end_time, shuttles_used FROM match{suffix}
+    WHERE status = 'completed' AND start_time IS NOT NULL AND end_time IS NOT NULL
+    AND id NOT IN (SELECT match_id FROM usage_event)
+    ''')
+    backfill = []
+    for match_id, court, start_time, end_time, shuttles_used in cursor.fetchall():
+        end = datetime.fromisoformat(end_time)
+        busy_seconds = max(0, int((end - datetime.fromisoformat(start_time)).total_seconds()))
+        backfill.append((match_id, court, 'start', start_time, 1))
+        backfill.append((match_id, court, 'end', end_time, busy_seconds))
+        if shuttles_used:
+            backfill.append((match_id, court, 'shuttle', end_time, shuttles_used))
+    cursor.executemany('''
+    INSERT INTO usage_event (match_id, court, kind, ts, value) VALUES (?, ?, ?, ?, ?)
+    ''', backfill)
+
+    # Sum every event's contributions in memory and write each bucket once
+    totals = {}
+    cursor.execute('SELECT kind, court, ts, value FROM usage_event')
+    for kind, court, ts, value in cursor.fetchall():
+        for granularity, bucket, bucket_court, shuttles, busy, matches in _contributions(
+                kind, court, datetime.fromisoformat(ts), value):
+            total = totals.setdefault((granularity, bucket, bucket_court), [0, 0, 0])
+            total[0] += shuttles
+            total[1] += busy
+            total[2] += matches
+
+    cursor.execute('DELETE FROM usage_rollup')
+    cursor.executemany('''
+    INSERT INTO usage_rollup (granularity, bucket, court, shuttles, busy_seconds, matches)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', [key + tuple(total) for key, total in totals.items()])
+    return {'backfilled_matches': len({event[0] for event in backfill}), 'buckets': len(totals)}
+
+
+def usage_stats(cursor, granularity='day', date_from=None, date_to=None, court=None):
+    """Shuttle use and court occupancy per bucket and per court, read from the rollups"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity {granularity}')
+    length = GRANULARITIES[granularity][1]
+
+    # Bucket labels sort chronologically and start with the date
+    filters = ''
+    params = []
+    if date_from:
+        filters += ' AND bucket >= ?'
+        params.append(date_from)
+    if date_to:
+        filters += ' AND bucket < ?'
+        params.append((datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'))
+    if court and court != 'all':
+        filters += ' AND court = ?'
+        params.append(court)
+
+    cursor.execute(f'''
+    SELECT bucket, court, shuttles, busy_seconds, matches FROM usage_rollup
+    WHERE granularity = ? {filters} ORDER BY bucket, court
+    ''', [granularity] + params)
+    series = [{
+        'bucket': bucket,
+        'court': bucket_court,
+        'shuttles': shuttles,
+        'matches': matches,
+        'busy_minutes': round(busy / 60, 1),
+        'utilization': round(busy / length, 4)
+    } for bucket, bucket_court, shuttles, busy, matches in cursor.fetchall()]
+
+    # Per-court totals; utilization is over the hours in which the court saw any play
+    cursor.execute(f'''
+    SELECT court, SUM(shuttles), SUM(busy_seconds), SUM(matches),
+           SUM(CASE WHEN busy_seconds > 0 THEN 1 ELSE 0 END)
+    FROM usage_rollup WHERE granularity = 'hour' {filters}
+    GROUP BY court ORDER BY court
+    ''', params)
+
+    courts = []
+    for court_name, shuttles, busy, matches, hours in cursor.fetchall():
+        courts.append({
+            'court': court_name,
+            'shuttles': shuttles,
+            'matches': matches,
+            'busy_hours': round(busy / 3600, 2),
+            'active_hours': hours,
+            'utilization': round(busy / (hours * 3600), 4) if hours else None,
+            'shuttles_per_match': round(shuttles / matches, 2) if matches else None
+        })
+
+    return {'granularity': granularity, 'series': series, 'courts': courts}